@@ -0,0 +1,91 @@
+"""
+Generates a deterministic synthetic corpus of text files for the benchmarks.
+
+    python benchmarks/corpus.py DIRECTORY [--files 1000] [--words 1000] [--vocabulary 20000] [--skew 1.0] [--seed 0]
+
+The same arguments always produce the same files, so timings of different releases are comparable.
+"""
+import argparse
+import os
+import random
+import string
+from typing import List
+
+
+SUFFIXES = ["", "", "s", "ing", "ed", "ly", "ness", ",", "."]
+
+
+def make_vocabulary(vocabulary: int, rng: random.Random) -> List[str]:
+    stems = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8))) for _ in range(vocabulary)]
+    return [stem + rng.choice(SUFFIXES) for stem in stems]
+
+
+def zipf_weights(vocabulary: int, skew: float = 1.0) -> List[float]:
+    # natural language word frequencies roughly follow Zipf's law, skew is its exponent
+    return [1 / rank ** skew for rank in range(1, vocabulary + 1)]
+
+
+def make_text(words: int, vocabulary: int, seed: int = 0, skew: float = 1.0) -> str:
+    rng = random.Random(seed)
+    vocab = make_vocabulary(vocabulary, rng)
+    return " ".join(rng.choices(vocab, weights=zipf_weights(vocabulary, skew), k=words))
+
+
+def generate_corpus(directory: str, files: int = 1000, words: int = 1000, vocabulary: int = 20000,
+                    skew: float = 1.0, seed: int = 0, per_directory: int = 100) -> List[str]:
+    """
+    Writes files of Zipf distributed words into subdirectories of directory.
+
+    :param directory: Where to write the corpus. Created if missing.
+    :param files: Number of files.
+    :param words: Average number of words per file. File lengths vary between half and one and a half times this.
+    :param vocabulary: Number of distinct words.
+    :param skew: Exponent of the Zipf distribution, higher values repeat the most common words more.
+    :param seed: Seed of the random generator.
+    :param per_directory: Number of files per subdirectory.
+    :return: The paths of the files, in the order they were written.
+    """
+    rng = random.Random(seed)
+    vocab = make_vocabulary(vocabulary, rng)
+    weights = zipf_weights(vocabulary, skew)
+    # cumulative weights once instead of on every choices call
+    cum_weights = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cum_weights.append(total)
+
+    paths = []
+    for i in range(files):
+        subdirectory = os.path.join(directory, f"{i // per_directory:04d}")
+        os.makedirs(subdirectory, exist_ok=True)
+        length = rng.randint(max(1, words // 2), max(1, words * 3 // 2))
+        lines = []
+        remaining = length
+        while remaining > 0:
+            count = min(remaining, rng.randint(8, 16))
+            lines.append(" ".join(rng.choices(vocab, cum_weights=cum_weights, k=count)))
+            remaining -= count
+        path = os.path.join(subdirectory, f"doc{i:06d}.{'md' if i % 5 == 0 else 'txt'}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=1000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.directory, args.files, args.words, args.vocabulary, args.skew, args.seed)
+    print(f"{len(paths)} files, {sum(os.path.getsize(path) for path in paths):,} bytes in {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
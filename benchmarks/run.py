@@ -0,0 +1,208 @@
+"""
+Times building the index, tokenizing, token and phrase search and previews on a synthetic corpus, and writes the
+results as JSON.
+
+    python benchmarks/run.py [--files 1000] [--words 1000] [--vocabulary 20000] [--skew 1.0] [--seed 0]
+                             [--queries 200] [--workers 1] [--output results.json] [--baseline old.json]
+
+Every scenario reports its throughput, latency percentiles in milliseconds and the peak memory traced while it ran
+once more under tracemalloc. With --metrics, the stage timers and counters of the searcher are added. With
+--baseline, the throughput of each scenario is compared to an earlier result file.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from paPYrus.config import INDEX_VERSION
+from paPYrus.metrics import Metrics
+from paPYrus.searcher import ScrollSearch
+
+from corpus import generate_corpus
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {
+        "mean_ms": 1000 * sum(ordered) / len(ordered),
+        "p50_ms": 1000 * pick(0.5),
+        "p90_ms": 1000 * pick(0.9),
+        "p99_ms": 1000 * pick(0.99),
+        "max_ms": 1000 * ordered[-1],
+    }
+
+
+def peak_memory(function) -> int:
+    # tracemalloc slows everything down, so memory is measured on a separate run from the timings
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_scenario(unit: str, items, function, repeat: int = 1) -> dict:
+    """
+    Calls function once per item and measures every call.
+
+    :param unit: What function returns a count of, e.g. "files" or "queries".
+    :param items: The arguments to call function with.
+    :param function: Returns how many units it processed.
+    :param repeat: Number of rounds. Latencies of all rounds are pooled, the throughput is the best round's.
+    :return: The results of the scenario.
+    """
+    samples = []
+    best = None
+    for _ in range(repeat):
+        count = 0
+        start = time.perf_counter()
+        for item in items:
+            call_start = time.perf_counter()
+            count += function(item)
+            samples.append(time.perf_counter() - call_start)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[1]:
+            best = (count, seconds)
+    count, seconds = best
+    result = {"calls": len(items), unit: count, "seconds": seconds,
+              f"{unit}_per_second": count / seconds if seconds else None}
+    result.update(percentiles(samples))
+    result["peak_memory_bytes"] = peak_memory(lambda: [function(item) for item in items])
+    return result
+
+
+def make_queries(searcher: ScrollSearch, paths, count: int, rng: random.Random):
+    """
+    Picks token queries and phrase queries from the corpus, so they find something.
+
+    :return: A tuple (token_queries, phrase_queries).
+    """
+    token_queries, phrase_queries = [], []
+    for _ in range(count):
+        words = searcher.read_document(rng.choice(paths)).split()
+        length = rng.randint(1, 3)
+        token_queries.append(" ".join(rng.sample(words, min(length, len(words)))))
+        start = rng.randrange(max(1, len(words) - length))
+        phrase_queries.append(" ".join(words[start:start + length + 1]))
+    return token_queries, phrase_queries
+
+
+def clear_caches(searcher: ScrollSearch):
+    searcher.query_cache.clear()
+    searcher.result_cache.clear()
+    searcher.preview_cache.clear()
+
+
+def run(args) -> dict:
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="papyrus-bench-") as directory:
+        paths = generate_corpus(directory, args.files, args.words, args.vocabulary, args.skew, args.seed)
+        corpus_bytes = sum(os.path.getsize(path) for path in paths)
+        scenarios = {}
+
+        def build(_):
+            ScrollSearch(directory, persist=False, workers=args.workers)
+            return len(paths)
+
+        scenarios["build_index"] = run_scenario("files", [None], build, args.repeat)
+        scenarios["build_index"]["bytes_per_second"] = corpus_bytes / scenarios["build_index"]["seconds"]
+
+        searcher = ScrollSearch(directory, persist=False, workers=args.workers,
+                                metrics=Metrics() if args.metrics else None)
+        texts = [searcher.read_document(path) for path in paths]
+        scenarios["tokenize"] = run_scenario("tokens", texts, lambda text: len(searcher.tokenize(text)), args.repeat)
+
+        token_queries, phrase_queries = make_queries(searcher, paths, args.queries, rng)
+
+        def search(query, phrase_search):
+            clear_caches(searcher)
+            return len(searcher.search(query, phrase_search, args.limit))
+
+        # the caches are cleared before every query, so these time the search itself
+        scenarios["search_token"] = run_scenario("hits", token_queries, lambda query: search(query, False))
+        scenarios["search_phrase"] = run_scenario("hits", phrase_queries, lambda query: search(query, True))
+        # the same queries again without clearing, as when a query is repeated
+        for query in token_queries:
+            searcher.search(query, False, args.limit)
+        scenarios["search_token_cached"] = run_scenario(
+            "hits", token_queries, lambda query: len(searcher.search(query, False, args.limit)))
+
+        previews = [(path, searcher.tokenize(query)) for query in token_queries
+                    for path, _ in searcher.rank(query, False, 10)]
+
+        def preview(item):
+            searcher.preview_cache.clear()
+            searcher._get_preview(*item)
+            return 1
+
+        scenarios["preview"] = run_scenario("previews", previews, preview)
+
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "index_version": INDEX_VERSION,
+            "corpus_bytes": corpus_bytes,
+            "parameters": vars(args),
+        },
+        "scenarios": scenarios,
+    }
+    if args.metrics:
+        results["metrics"] = searcher.metrics_snapshot()
+    return results
+
+
+def compare(results: dict, baseline: dict):
+    # throughput ratios, above 1 is faster than the baseline
+    for name, scenario in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        rate = next((key for key in scenario if key.endswith("_per_second") and key != "bytes_per_second"), None)
+        if old is None or rate is None or not old.get(rate) or not scenario[rate]:
+            continue
+        print(f"{name:22} {scenario[rate] / old[rate]:6.2f}x {rate}, p50 {old.get('p50_ms', 0):.3f}ms -> "
+              f"{scenario.get('p50_ms', 0):.3f}ms", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=1000, help="average number of words per file")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--skew", type=float, default=1.0, help="exponent of the Zipf distribution of words")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=100, help="hits per search")
+    parser.add_argument("--workers", type=int, default=1, help="processes used to build the index")
+    parser.add_argument("--repeat", type=int, default=3, help="rounds of the build and tokenize scenarios")
+    parser.add_argument("--metrics", action="store_true", help="also record and output the stage metrics of the searcher")
+    parser.add_argument("--output", help="write the JSON here instead of to stdout")
+    parser.add_argument("--baseline", help="JSON of an earlier run to compare to")
+    args = parser.parse_args()
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compares the tokens per second of the original ScrollSearch.tokenize with the Analyzer.
+
+    python benchmarks/tokenizer.py [--words 500000] [--vocabulary 20000] [--repeat 3]
+"""
+import argparse
+import io
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nltk.stem import PorterStemmer
+
+from paPYrus.analyzer import Analyzer
+
+from corpus import make_text
+
+
+def legacy_tokenize(text, stemmer):
+    # ScrollSearch.tokenize before the Analyzer: new table on every call and one stem call per token
+    translator = str.maketrans("", "", string.punctuation)
+    tokens = text.translate(translator).lower().split()
+    return [stemmer.stem(token) for token in tokens]
+
+
+def best_of(repeat: int, function):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = function()
+        best = min(best, time.perf_counter() - start)
+    return count, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=500000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = make_text(args.words, args.vocabulary)
+    stemmer = PorterStemmer()
+    scenarios = {
+        "legacy tokenize": lambda: len(legacy_tokenize(text, stemmer)),
+        # a new analyzer per run so the stem cache starts cold every time
+        "Analyzer.analyze": lambda: len(Analyzer().analyze(text)),
+        "Analyzer.stream_positions": lambda: sum(1 for _ in Analyzer().stream_positions(io.StringIO(text))),
+        "Analyzer(stemmer=None).analyze": lambda: len(Analyzer(stemmer=None).analyze(text)),
+    }
+    baseline = None
+    for name, function in scenarios.items():
+        tokens, seconds = best_of(args.repeat, function)
+        rate = tokens / seconds
+        baseline = baseline or rate
+        print(f"{name:32} {tokens:>9} tokens {seconds:8.3f}s {rate:>12,.0f} tokens/s {rate / baseline:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,26 @@
 from .config import *
-from .searcher import ScrollSearch
-from .gui import TextSearchGUI
 
 
-__all__ = ["ScrollSearch", "TextSearchGUI"]
\ No newline at end of file
+# the GUI pulls in tkinter and the searcher builds indexes, so both are only imported once they are used
+_LAZY = {
+    "ScrollSearch": ".searcher",
+    "ShardedSearch": ".shards",
+    "TextSearchGUI": ".gui",
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
+
+
+__all__ = ["ScrollSearch", "ShardedSearch", "TextSearchGUI"]
@@ -0,0 +1,160 @@
+import string
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .config import *
+
+
+# Removes punctuation, built once instead of on every call
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+
+class Analyzer:
+    """
+    Turns text into index tokens: removes punctuation, lowercases, splits on whitespace, drops stopwords and stems.
+
+    Natural language text keeps repeating a small vocabulary, so stems are memoized in a bounded cache.
+    """
+
+    def __init__(self, stemmer="porter", stopwords: Optional[Iterable[str]] = None,
+                 stem_cache_size: int = STEM_CACHE_SIZE):
+        """
+        Initializes the Analyzer object.
+
+        :param stemmer: "porter" for the nltk Porter stemmer, None to not stem, or any object with a stem method.
+            Such an object should have a signature attribute, e.g. "snowball-german", telling it apart from stemmers
+            with other output, or a repr that does. Without either, indexes built with it are not saved.
+        :param stopwords: Lowercase words that are left out of the tokens. Their positions are still counted.
+        :param stem_cache_size: Maximum number of memoized stems.
+        """
+        self.stemmer = stemmer
+        self.stopwords = frozenset(stopwords or ())
+        self.stem_cache_size = stem_cache_size
+        self._setup()
+
+    def _setup(self):
+        """
+        Creates the stemmer and the stem cache, which are not pickled.
+        """
+        stemmer = self.stemmer
+        if stemmer == "porter":
+            from nltk.stem import PorterStemmer
+            stemmer = PorterStemmer()
+        self._stem = lru_cache(maxsize=self.stem_cache_size)(stemmer.stem) if stemmer is not None else None
+
+    def __getstate__(self):
+        # the stem cache is not worth shipping to index build workers
+        return {"stemmer": self.stemmer, "stopwords": self.stopwords, "stem_cache_size": self.stem_cache_size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
+    def signature(self) -> Optional[tuple]:
+        """
+        Identifies the token output of the analyzer, so that an index built with another one is not reused.
+
+        :return: A tuple describing the stemmer and the stopwords, or None if the stemmer can not be identified.
+        """
+        stemmer = self.stemmer
+        if stemmer not in ("porter", None):
+            if hasattr(stemmer, "signature"):
+                stemmer = stemmer.signature() if callable(stemmer.signature) else stemmer.signature
+            elif type(stemmer).__repr__ is not object.__repr__:
+                stemmer = f"{type(stemmer).__module__}.{type(stemmer).__qualname__}: {stemmer!r}"
+            else:
+                # the default repr holds the address of the object, and the class alone does not tell e.g. the
+                # languages of a SnowballStemmer apart
+                return None
+        return stemmer, tuple(sorted(self.stopwords))
+
+    def stem(self, token: str) -> str:
+        """
+        Stems a single lowercase token.
+
+        :param token: The token.
+        :return: The memoized stem, or the token itself if stemming is off.
+        """
+        return self._stem(token) if self._stem is not None else token
+
+    def stem_cache_info(self):
+        """
+        Returns the hit and miss counters of the stem cache.
+
+        :return: The cache_info of the memoized stemmer, or None if stemming is off.
+        """
+        return self._stem.cache_info() if self._stem is not None else None
+
+    def split(self, text: str) -> List[str]:
+        """
+        Removes punctuation, lowercases and splits text, without stemming.
+
+        :param text: The text to split.
+        :return: A list of words.
+        """
+        return text.translate(PUNCTUATION_TABLE).lower().split()
+
+    def analyze(self, text: str) -> List[str]:
+        """
+        Tokenizes text.
+
+        :param text: The text to be tokenized.
+        :return: A list of stemmed tokens without stopwords.
+        """
+        words = self.split(text)
+        if self.stopwords:
+            words = [word for word in words if word not in self.stopwords]
+        if self._stem is None:
+            return words
+        return list(map(self._stem, words))
+
+    def positions(self, text: str, start: int = 0) -> Iterator[Tuple[int, str]]:
+        """
+        Tokenizes text and numbers the tokens. Stopwords are left out but keep their position, so phrases
+        containing them still line up.
+
+        :param text: The text to be tokenized.
+        :param start: The position of the first word.
+        :return: An iterator of (position, token) pairs.
+        """
+        return self._number(self.split(text), start)
+
+    def stream_positions(self, f, chunk_size: int = TOKENIZE_CHUNK_SIZE) -> Iterator[Tuple[int, str]]:
+        """
+        Tokenizes an open text file chunk by chunk, so large files never have to be held in memory at once.
+        Yields exactly what positions would for the whole content.
+
+        :param f: A file opened in text mode.
+        :param chunk_size: How many characters to read at a time.
+        :return: An iterator of (position, token) pairs.
+        """
+        position = 0
+        carry = ""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            text = (carry + chunk).translate(PUNCTUATION_TABLE).lower()
+            words = text.split()
+            # a word cut off at the end of the chunk is finished by the next one. Punctuation is gone by now, so a
+            # chunk ending in "(" after a space does not glue its last word to the next chunk
+            carry = words.pop() if words and not text[-1].isspace() else ""
+            yield from self._number(words, position)
+            position += len(words)
+        if carry:
+            yield from self._number([carry], position)
+
+    def _number(self, words: List[str], start: int) -> Iterator[Tuple[int, str]]:
+        """
+        Stems split words and pairs them with their positions, leaving out stopwords.
+
+        :param words: The words as returned by split.
+        :param start: The position of the first word.
+        :return: An iterator of (position, token) pairs.
+        """
+        tokens = map(self._stem, words) if self._stem is not None else words
+        if not self.stopwords:
+            return enumerate(tokens, start)
+        stopwords = self.stopwords
+        return ((position, token) for position, (word, token) in enumerate(zip(words, tokens), start)
+                if word not in stopwords)
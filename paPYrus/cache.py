@@ -0,0 +1,104 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+class LRUCache:
+    """
+    A least recently used cache bounded by number of entries and/or by the total size of its values.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 sizeof: Callable = sys.getsizeof):
+        """
+        Initializes the LRUCache object.
+
+        :param max_entries: Maximum number of entries, or None for no limit.
+        :param max_bytes: Maximum total size of the values as measured by sizeof, or None for no limit.
+        :param sizeof: Function returning the size of a value in bytes.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.size = 0  # total size of the cached values in bytes
+        self._entries = OrderedDict()  # key -> (value, size), least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Looks up a key and marks it as most recently used.
+
+        :param key: The key to look up.
+        :param default: Returned if the key is not cached.
+        :return: The cached value or default.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Caches a value, evicting the least recently used entries if a limit is exceeded.
+        A value that is larger than max_bytes on its own is not cached.
+
+        :param key: The key of the value.
+        :param value: The value to cache.
+        """
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while (self.max_entries is not None and len(self._entries) > self.max_entries) \
+                    or (self.max_bytes is not None and self.size > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def pop(self, key, default=None):
+        """
+        Removes a key from the cache.
+
+        :param key: The key to remove.
+        :param default: Returned if the key is not cached.
+        :return: The value that was cached or default.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.size -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        """
+        Empties the cache. The hit and miss counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the cache.
+
+        :return: A dictionary with the hits, misses, number of entries and total size in bytes.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self.size}
@@ -0,0 +1,120 @@
+"""
+Searches a directory of notes from the command line, without the GUI.
+
+    papyrus-search DIRECTORY "some words" "another query"
+    papyrus-search DIRECTORY --file queries.txt --json
+    printf 'first query\nsecond query\n' | papyrus-search DIRECTORY
+
+With --serve, it keeps the index loaded and answers queries over a Unix socket instead. Later calls for the same
+directory then send their queries to that daemon automatically, which takes milliseconds per query instead of
+loading the index every time.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from .config import *
+from .daemon import DaemonClient, default_socket_path, run_query
+
+
+def read_queries(args) -> Iterable[str]:
+    """
+    Collects the queries from the arguments, the query file or stdin, skipping empty lines.
+    """
+    if args.queries:
+        yield from args.queries
+        return
+    f = sys.stdin if args.file in (None, "-") else open(args.file, encoding="utf-8")
+    with f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def print_results(query: str, results: List[dict], as_json: bool, out=sys.stdout):
+    if as_json:
+        out.write(json.dumps({"query": query, "results": results}) + "\n")
+        return
+    out.write(f"# {query}: {len(results)} files\n")
+    for result in results:
+        out.write(f"{result['score']:8.3f}  {result['path']}\n")
+        if "preview" in result:
+            out.write("          " + " ".join(result["preview"].split()) + "\n")
+    out.write("\n")
+
+
+def connect(args) -> Optional[DaemonClient]:
+    """
+    Connects to the daemon of the directory, if one is running.
+    """
+    if args.no_daemon:
+        return None
+    try:
+        return DaemonClient(args.socket or default_socket_path(args.directory))
+    except OSError:
+        if args.socket:
+            raise
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="papyrus-search", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="the directory of text files to search")
+    parser.add_argument("queries", nargs="*", help="queries to run, read from --file or stdin if there are none")
+    parser.add_argument("-f", "--file", help="file with one query per line, - for stdin")
+    parser.add_argument("-p", "--phrase", action="store_true", help="match the queries as phrases")
+    parser.add_argument("-n", "--limit", type=int, default=RESULT_LIMIT, help="files per query, 0 for all of them")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per query")
+    parser.add_argument("--no-preview", action="store_true", help="only print paths and scores")
+    parser.add_argument("--serve", action="store_true", help="run a daemon that keeps the index warm")
+    parser.add_argument("--socket", help="Unix socket of the daemon, defaults to one next to the saved index")
+    parser.add_argument("--no-daemon", action="store_true", help="load the index here even if a daemon is running")
+    parser.add_argument("--workers", type=int, default=INDEX_WORKERS,
+                        help="processes used to build the index, 0 for every core")
+    args = parser.parse_args(argv)
+    # resolved here, so the daemon prints the same absolute paths whatever its working directory
+    args.directory = str(Path(args.directory).resolve())
+    limit = args.limit or None
+
+    if args.serve:
+        from .daemon import QueryDaemon
+        from .searcher import ScrollSearch
+        try:
+            searcher = ScrollSearch(args.directory, workers=args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+        daemon = QueryDaemon(searcher, args.socket)
+        print(f"Serving {args.directory} on {daemon.socket_path}", file=sys.stderr)
+        daemon.serve_forever()
+        return 0
+
+    client = connect(args)
+    if client is None:
+        from .searcher import ScrollSearch
+        try:
+            searcher = ScrollSearch(args.directory, workers=args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+        search = lambda query: run_query(searcher, query, args.phrase, limit, not args.no_preview)
+    else:
+        search = lambda query: client.query(query, args.phrase, limit, not args.no_preview)
+
+    try:
+        for query in read_queries(args):
+            print_results(query, search(query), args.json)
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # e.g. piped into head
+        pass
+    finally:
+        if client is not None:
+            client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
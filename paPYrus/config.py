@@ -1,5 +1,70 @@
+import os
+
 #Allowed FIle extensions
 FILE_TYPES = {".txt", ".md", ""}
 
 #text preview length
-PREVIEW_LENGTH = 200
\ No newline at end of file
+PREVIEW_LENGTH = 200
+
+#where the on-disk indexes are kept, one file per indexed directory
+INDEX_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "papyrus")
+
+#bump whenever the layout or the tokens of the saved index change so old files get rebuilt
+INDEX_VERSION = 7
+
+#worker processes used to build the index, 1 builds serially and 0 uses every core
+INDEX_WORKERS = 1
+
+#below this many files to (re)index a parallel build is not worth starting a process pool for
+PARALLEL_MIN_FILES = 64
+
+#how much text of recently viewed documents is kept in memory, in bytes
+DOCUMENT_CACHE_BYTES = 32 * 1024 * 1024
+
+#how many distinct words keep their stem memoized while tokenizing
+STEM_CACHE_SIZE = 1 << 16
+
+#files are tokenized this many characters at a time
+TOKENIZE_CHUNK_SIZE = 1 << 20
+
+#number of results a search returns unless told otherwise, None returns every match
+RESULT_LIMIT = 100
+
+#BM25 ranking parameters: term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+#bounds of the search caches: analyzed queries by count, rankings and previews by size in bytes
+QUERY_CACHE_ENTRIES = 1024
+RESULT_CACHE_BYTES = 16 * 1024 * 1024
+PREVIEW_CACHE_BYTES = 8 * 1024 * 1024
+
+#file watching: seconds of quiet before a burst of changes is applied, longest a change may wait while a burst
+#goes on, and how often the directory is rescanned where inotify is not available
+WATCH_DEBOUNCE = 0.5
+WATCH_MAX_DELAY = 5.0
+WATCH_POLL_INTERVAL = 2.0
+
+#run the search while typing instead of only on Enter, after this many milliseconds without a key press
+SEARCH_AS_YOU_TYPE = False
+SEARCH_DELAY_MS = 250
+
+#how often the window picks up progress and results from the background threads, in milliseconds
+GUI_POLL_MS = 50
+
+#entries of a directory shown in the file tree before a "more" line that loads the next page
+TREE_PAGE_SIZE = 500
+
+#the file viewer loads files in chunks of about this many bytes and keeps at most this many chunks in the widget
+VIEWER_CHUNK_BYTES = 64 * 1024
+VIEWER_MAX_CHUNKS = 4
+
+#a ShardedSearch splits each of its directories into this many shard indexes by hashing the file paths
+SHARDS_PER_ROOT = 1
+
+#a wildcard (auth*, colo?r) or fuzzy (recieve~) query term matches at most this many terms, the most frequent first
+MAX_EXPANSIONS = 64
+
+#edit distance of a fuzzy query term written as word~, word~2 asks for more, up to MAX_FUZZY_DISTANCE
+FUZZY_DISTANCE = 1
+MAX_FUZZY_DISTANCE = 2
@@ -0,0 +1,221 @@
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+from .config import *
+
+
+def default_socket_path(directory) -> Path:
+    """
+    Returns where the daemon for a directory listens by default: next to its saved index.
+
+    :param directory: The indexed directory.
+    :return: A path under INDEX_DIR unique to the resolved directory.
+    """
+    from .searcher import ScrollSearch
+    return ScrollSearch.default_index_path(directory).with_suffix(".sock")
+
+
+def run_query(searcher, query: str, phrase_search: bool = False, limit: Optional[int] = RESULT_LIMIT,
+              previews: bool = True) -> List[dict]:
+    """
+    Runs a query the way the command line and the daemon report it.
+
+    :param searcher: The ScrollSearch to query.
+    :param query: The search query.
+    :param phrase_search: If True, performs a phrase search. If False, performs a token search.
+    :param limit: How many of the best matches to return, or None for all of them.
+    :param previews: If False, previews are not built.
+    :return: A list of {"path", "score"} dictionaries, with a "preview" if previews is True, best match first.
+    """
+    with searcher.lock:
+        hits = searcher.rank(query, phrase_search, limit)
+        results = [{"path": path, "score": score} for path, score in hits]
+        if previews and results:
+            tokens = searcher.query_terms(query)
+            for result in results:
+                result["preview"] = searcher._get_preview(result["path"], tokens)
+    return results
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers the JSON lines of one client connection, one response line per request line.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.query_daemon.handle_request(json.loads(line))
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {str(e)}"}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class QueryDaemon:
+    """
+    Keeps the index of a directory loaded and up to date and answers queries over a local Unix socket, so scripts
+    don't pay for starting Python, loading the index and warming the caches on every query.
+
+    The protocol is one JSON object per line in each direction. A request is either a query,
+    {"query": "...", "phrase": false, "limit": 100, "previews": true}, answered with {"results": [...]} as returned
+    by run_query, or a command, {"command": "refresh"}, {"command": "stats"} or {"command": "shutdown"}. Errors are
+    answered with {"error": "..."}.
+    """
+
+    def __init__(self, searcher, socket_path=None, watch: bool = True):
+        """
+        Initializes the QueryDaemon object.
+
+        :param searcher: The ScrollSearch to serve.
+        :param socket_path: Where to listen. Defaults to default_socket_path of the searcher's directory.
+        :param watch: If True, an IndexWatcher keeps the index up to date while the daemon runs.
+        """
+        self.searcher = searcher
+        self.socket_path = Path(socket_path) if socket_path else default_socket_path(searcher.directory)
+        self.watch = watch
+        self.server = None
+        self.watcher = None
+
+    def handle_request(self, request: dict) -> dict:
+        """
+        Answers one request.
+
+        :param request: The decoded request line.
+        :return: The response.
+        """
+        command = request.get("command")
+        if command is None:
+            limit = request.get("limit", RESULT_LIMIT)
+            return {"results": run_query(self.searcher, str(request["query"]), bool(request.get("phrase", False)),
+                                         None if limit is None else int(limit), bool(request.get("previews", True)))}
+        if command == "refresh":
+            added, removed = self.searcher.build_index()
+            return {"added": added, "removed": removed}
+        if command == "stats":
+            return self.searcher.metrics_snapshot()
+        if command == "shutdown":
+            # shutdown waits for serve_forever, which runs in another thread than this handler
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {"ok": True}
+        raise ValueError(f"Unknown command {command}.")
+
+    def _bind(self):
+        """
+        Creates the listening socket, replacing a socket file left behind by a daemon that did not shut down cleanly.
+
+        :raises OSError: If another daemon is already listening there.
+        """
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(str(self.socket_path))
+            except OSError:
+                self.socket_path.unlink()
+            else:
+                raise OSError(f"A daemon is already listening on {self.socket_path}.")
+        # the index may hold private notes, only the owner gets to query it. The umask applies from the moment bind
+        # creates the socket file, where a chmod afterwards would leave it open to others for a moment
+        umask = os.umask(0o177)
+        try:
+            self.server = _Server(str(self.socket_path), _RequestHandler)
+        finally:
+            os.umask(umask)
+        self.server.query_daemon = self
+
+    def serve_forever(self):
+        """
+        Listens until a shutdown command, SIGTERM or Ctrl+C, then removes the socket.
+        """
+        self._bind()
+        if self.watch:
+            from .watcher import IndexWatcher
+            self.watcher = IndexWatcher(self.searcher)
+            self.watcher.start()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *args: threading.Thread(target=self.server.shutdown).start())
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            if self.watcher is not None:
+                self.watcher.stop()
+            try:
+                self.socket_path.unlink()
+            except OSError:
+                pass
+
+
+class DaemonClient:
+    """
+    Sends requests to a running QueryDaemon over one connection.
+    """
+
+    def __init__(self, socket_path, timeout: Optional[float] = None):
+        """
+        Initializes the DaemonClient object and connects.
+
+        :param socket_path: Where the daemon listens.
+        :param timeout: Seconds to wait for an answer, None to wait forever.
+        :raises OSError: If no daemon is listening.
+        """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        try:
+            self.socket.connect(str(socket_path))
+        except OSError:
+            self.socket.close()
+            raise
+        self.file = self.socket.makefile("rwb")
+
+    def request(self, request: dict) -> dict:
+        """
+        Sends a request and waits for its response.
+
+        :param request: The request, see QueryDaemon.
+        :return: The response.
+        :raises RuntimeError: If the daemon answered with an error.
+        """
+        self.file.write(json.dumps(request).encode("utf-8") + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("The daemon closed the connection.")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def query(self, query: str, phrase_search: bool = False, limit: Optional[int] = RESULT_LIMIT,
+              previews: bool = True) -> List[dict]:
+        """
+        Runs a query in the daemon.
+
+        :return: The results, see run_query.
+        """
+        return self.request({"query": query, "phrase": phrase_search, "limit": limit, "previews": previews})["results"]
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
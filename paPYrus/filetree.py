@@ -0,0 +1,150 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .config import *
+
+
+class TreeRow:
+    """
+    One line of the file tree.
+    """
+    __slots__ = ("path", "name", "depth", "kind")
+
+    def __init__(self, path: str, name: str, depth: int, kind: str):
+        self.path = path  # for a "more" row, the directory whose entries it stands for
+        self.name = name
+        self.depth = depth
+        self.kind = kind  # "dir", "file" or "more"
+
+    def text(self) -> str:
+        """
+        Renders the row the way it is shown in the tree.
+
+        :return: The line, including the newline.
+        """
+        return "│   " * self.depth + "├── " + self.name + "\n"
+
+
+class FileTreeModel:
+    """
+    The rows of the file tree, kept apart from the widget showing them.
+
+    Directory listings are cached and only read again when the directory's mtime changed. Expanding or collapsing a
+    directory only touches the rows below it, and directories with more than page_size entries show them one page
+    at a time behind a "more" row.
+    """
+
+    def __init__(self, root, page_size: int = TREE_PAGE_SIZE):
+        """
+        Initializes the FileTreeModel object.
+
+        :param root: The directory at the top of the tree.
+        :param page_size: How many entries of a directory are shown before a "more" row.
+        """
+        self.root = str(root)
+        self.page_size = page_size
+        self.listings: Dict[str, Tuple[int, List[Tuple[str, bool]]]] = {}  # dir -> (mtime_ns, [(name, is_dir)])
+        self.expanded = set()  # directories whose entries are shown
+        self.shown: Dict[str, int] = {}  # dir -> number of its entries that are shown
+        self.rows: List[TreeRow] = self._children(self.root, 0)
+
+    def listing(self, directory: str) -> List[Tuple[str, bool]]:
+        """
+        Returns the sorted entries of a directory, from the cache unless the directory changed.
+
+        :param directory: The directory.
+        :return: A list of (name, is_dir) tuples.
+        """
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            self.listings.pop(directory, None)
+            return []
+        cached = self.listings.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        entries = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        # scandir knows the type from the directory itself, no stat per entry
+                        entries.append((entry.name, entry.is_dir()))
+                    except OSError:
+                        continue
+        except OSError:
+            return []
+        entries.sort()
+        self.listings[directory] = (mtime, entries)
+        return entries
+
+    def _children(self, directory: str, depth: int) -> List[TreeRow]:
+        """
+        Builds the rows for the shown entries of a directory and, recursively, of its expanded subdirectories.
+
+        :param directory: The directory.
+        :param depth: The depth of its entries in the tree.
+        :return: The rows.
+        """
+        entries = self.listing(directory)
+        shown = min(max(self.shown.get(directory, 0), self.page_size), len(entries))
+        self.shown[directory] = shown
+        rows = []
+        for name, is_dir in entries[:shown]:
+            path = os.path.join(directory, name)
+            rows.append(TreeRow(path, name, depth, "dir" if is_dir else "file"))
+            if is_dir and path in self.expanded:
+                rows.extend(self._children(path, depth + 1))
+        if shown < len(entries):
+            rows.append(TreeRow(directory, f"... {len(entries) - shown} more", depth, "more"))
+        return rows
+
+    def _subtree_end(self, index: int) -> int:
+        """
+        Finds where the rows below a row end.
+
+        :param index: The index of the row.
+        :return: The index of the first row after its subtree.
+        """
+        depth = self.rows[index].depth
+        end = index + 1
+        while end < len(self.rows) and self.rows[end].depth > depth:
+            end += 1
+        return end
+
+    def toggle(self, index: int) -> Optional[Tuple[int, int, List[TreeRow]]]:
+        """
+        Expands or collapses the directory of a row, or shows the next page of entries for a "more" row.
+
+        :param index: The index of the clicked row.
+        :return: A tuple (start, removed, inserted): at start, removed rows were taken out and inserted rows put in,
+            or None if the row is a file.
+        """
+        row = self.rows[index]
+        if row.kind == "dir":
+            if row.path in self.expanded:
+                self.expanded.discard(row.path)
+                start, end = index + 1, self._subtree_end(index)
+                del self.rows[start:end]
+                return start, end - start, []
+            self.expanded.add(row.path)
+            inserted = self._children(row.path, row.depth + 1)
+            self.rows[index + 1:index + 1] = inserted
+            return index + 1, 0, inserted
+        if row.kind == "more":
+            directory = row.path
+            entries = self.listing(directory)
+            start = self.shown[directory]
+            end = min(start + self.page_size, len(entries))
+            self.shown[directory] = end
+            inserted = []
+            for name, is_dir in entries[start:end]:
+                path = os.path.join(directory, name)
+                inserted.append(TreeRow(path, name, row.depth, "dir" if is_dir else "file"))
+                if is_dir and path in self.expanded:
+                    inserted.extend(self._children(path, row.depth + 1))
+            if end < len(entries):
+                inserted.append(TreeRow(directory, f"... {len(entries) - end} more", row.depth, "more"))
+            self.rows[index:index + 1] = inserted
+            return index, 1, inserted
+        return None
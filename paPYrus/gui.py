@@ -1,10 +1,17 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext, messagebox
-import os,sys
+import sys
 from pathlib import Path
 import platform
+import queue
+import re
+import threading
+from collections import deque
 
+from .filetree import FileTreeModel
 from .searcher import ScrollSearch
+from .viewer import FileWindow
+from .watcher import IndexWatcher
 from .config import *
 
 class TextSearchGUI(tk.Tk):
@@ -31,9 +38,22 @@ class TextSearchGUI(tk.Tk):
         
         self.create_widgets()
         self.current_directory = Path.cwd()
-        self.expanded_dirs = set()
-        self.searcher = ScrollSearch(str(self.current_directory))
+        self.tree_model = None  # Rows of the file tree, line n of file_tree_text shows tree_model.rows[n - 1]
+        self.searcher = None  # Set once the indexing thread is done
+        self.watcher = None  # Keeps the index up to date while the app is open
+        self.events = queue.Queue()  # Messages from the worker threads, handled on the Tk thread
+        self.index_id = 0  # Tells apart the results of an indexing thread for a directory that is no longer shown
+        self.search_id = 0  # Same for searches, results of older searches are dropped
+        self.search_cancel = threading.Event()  # Set to stop the search that is running
+        self.search_after = None  # Pending search-as-you-type timer
+        self.locate_id = 0  # Same for looking up the match in a selected result, only the last selection is opened
+        self.viewer = None  # FileWindow of the file shown in the preview box
+        self.viewer_chunks = deque()  # (start, end, characters) of the chunks of it that are in the preview box
+        self.viewer_terms = []  # Terms highlighted in the preview box
+        self.viewer_check = None  # Pending check whether more of the file has to be loaded
         self.build_file_tree(self.current_directory)
+        self.start_indexing(self.current_directory)
+        self.after(GUI_POLL_MS, self.process_events)
 
     def create_widgets(self):
         # Frame for the file tree
@@ -49,6 +69,17 @@ class TextSearchGUI(tk.Tk):
         self.search_entry = ttk.Entry(self.search_frame, textvariable=self.search_var)
         self.search_entry.pack(fill="x")
         self.search_entry.bind("<Return>", self.perform_search)  # Bind Enter key to perform search
+        if SEARCH_AS_YOU_TYPE:
+            self.search_entry.bind("<KeyRelease>", self.schedule_search)
+
+        # Indexing progress and search status
+        self.status_frame = ttk.Frame(self.search_frame)
+        self.status_frame.pack(fill="x")
+        self.progress = ttk.Progressbar(self.status_frame, mode="determinate", length=150)
+        self.progress.pack(side="left")
+        self.status_var = tk.StringVar()
+        self.status_label = ttk.Label(self.status_frame, textvariable=self.status_var)
+        self.status_label.pack(side="left", fill="x", padx=5)
         
         # Text box for file preview
         self.text = tk.Text(self.search_frame, wrap="word")
@@ -59,6 +90,8 @@ class TextSearchGUI(tk.Tk):
         self.file_tree_text.pack(fill="both", expand=True)
         self.file_tree_text.tag_configure("dir", foreground="blue", underline=True)
         self.file_tree_text.tag_bind("dir", "<Button-1>", self.on_dir_click)
+        self.file_tree_text.tag_configure("more", foreground="grey")
+        self.file_tree_text.tag_bind("more", "<Button-1>", self.on_dir_click)
 
         # Listbox for search results
         self.results_listbox = tk.Listbox(self.search_frame)
@@ -68,6 +101,8 @@ class TextSearchGUI(tk.Tk):
         # Text box for file preview
         self.file_preview_text = scrolledtext.ScrolledText(self.search_frame, wrap="word")
         self.file_preview_text.pack(fill="both", expand=True)
+        self.file_preview_text.configure(yscrollcommand=self.on_preview_scroll)
+        self.file_preview_text.tag_configure("match", background="yellow")
 
         #button for clicking to open files
         self.file_tree_text.tag_bind("file", "<Button-1>", self.on_file_click)
@@ -96,107 +131,53 @@ class TextSearchGUI(tk.Tk):
 
     #Build file tree box
     def build_file_tree(self, directory):
+        self.tree_model = FileTreeModel(directory)
         self.file_tree_text.config(state="normal")
         self.file_tree_text.delete(1.0, "end")
-        self.generate_file_tree(directory)
+        self.insert_tree_rows(1, self.tree_model.rows)
         self.file_tree_text.config(state="disabled")
 
-    def generate_file_tree(self, directory, prefix=""):
-        tree_str = ""
-        line_num = 1
-        for path in sorted(directory.iterdir()):
-            if path.is_dir():
-                dir_line = prefix + "├── " + path.name + "\n"
-                self.file_tree_text.insert("end", dir_line, "dir")
-                start = f"{line_num}.{len(prefix) + 4}"
-                end = f"{line_num}.{len(prefix) + 4 + len(path.name)}"
-                self.file_tree_text.tag_add("dir", start, end)
-                line_num += 1
-                if path in self.expanded_dirs:
-                    added_lines = self.generate_file_tree(path, prefix + "│   ")
-                    line_num += added_lines
-            else:
-                file_line = prefix + "├── " + path.name + "\n"
-                self.file_tree_text.insert("end", file_line, "file")
-                start = f"{line_num}.{len(prefix) + 4}"
-                end = f"{line_num}.{len(prefix) + 4 + len(path.name)}"
-                self.file_tree_text.tag_add("file", start, end)
-                line_num += 1
-
-        return line_num - 1
-    
-    # code that executes after clicking a directory
-    def on_dir_click(self, event):
-        # Get the index of the text widget where the click occurred
-        index = self.file_tree_text.index("@%d,%d" % (event.x, event.y))
-        # Get the line of text at the click index
-        line = self.file_tree_text.get("%s linestart" % index, "%s lineend" % index)
-        
-        # Extract the directory name from the line of text
-        dir_name = line.split('├── ')[-1].strip()
-        if not dir_name:
-            # If the line is not a valid directory name, return early
-            #print("Clicked line is not a directory")
-            return
-        #print("Clicked on:", dir_name)
-        # Construct the full path to the clicked directory
-        clicked_dir = self.construct_full_path(dir_name, index)
-        #print("Full path:", clicked_dir)
-        if clicked_dir.is_dir():
-            if clicked_dir in self.expanded_dirs:
-                self.expanded_dirs.remove(clicked_dir)
-            else:
-                self.expanded_dirs.add(clicked_dir)
-            self.build_file_tree(self.current_directory)
-        #else:
-            #print("Clicked path is not a directory on the filesystem")
-
-    #reconstructs the path to a clicked on directory to allow nesting
-    def construct_full_path(self, dir_name, index):
-        constructed_path = Path(dir_name)
-        #print("Starting reconstruction with:", constructed_path)
-
-        line_num, col_num = map(int, index.split('.'))
-        indent_level = self.get_indent_level(self.file_tree_text.get(index + " linestart", index + " lineend"))
-        
-        while line_num > 0:
-            line_num -= 1
-            index = f"{line_num}.0"
-            line = self.file_tree_text.get(f"{index} linestart", f"{index} lineend")
-            line_indent_level = self.get_indent_level(line)
-            
-            if line_indent_level < indent_level:
-                parent_name = line.split('├── ')[-1].strip()
-                constructed_path = Path(parent_name) / constructed_path
-                #print("Parent dir updated to:", constructed_path)
-                indent_level = line_indent_level
-
-        full_path = self.current_directory / constructed_path
-        #print("Constructed full path:", full_path)
-        return full_path
+    #writes rows into the tree box starting at a line, one insert for all of them
+    def insert_tree_rows(self, line, rows):
+        chunks = []
+        for row in rows:
+            chunks.extend((row.text(), row.kind))
+        if chunks:
+            self.file_tree_text.insert(f"{line}.0", *chunks)
 
+    #finds the tree row under the mouse
+    def clicked_row(self, event):
+        index = self.file_tree_text.index("@%d,%d" % (event.x, event.y))
+        row_index = int(index.split('.')[0]) - 1
+        if 0 <= row_index < len(self.tree_model.rows):
+            return row_index
+        return None
 
-    #finds how far indendet a file or directory is so that it can be found
-    def get_indent_level(self, line):
-        return len(line) - len(line.lstrip('│   '))
-
+    # code that executes after clicking a directory or a "more" line
+    def on_dir_click(self, event):
+        row_index = self.clicked_row(event)
+        if row_index is None:
+            return
+        change = self.tree_model.toggle(row_index)
+        if change is None:
+            return
+        # only the lines of the toggled directory are touched, the rest of the tree stays as it is
+        start, removed, inserted = change
+        self.file_tree_text.config(state="normal")
+        if removed:
+            self.file_tree_text.delete(f"{start + 1}.0", f"{start + 1 + removed}.0")
+        self.insert_tree_rows(start + 1, inserted)
+        self.file_tree_text.config(state="disabled")
 
     #actions for clicking a file in the file tree
     def on_file_click(self, event):
         try:
-            # Get the index of the text widget where the click occurred
-            index = self.file_tree_text.index("@%d,%d" % (event.x, event.y))
-            # Get the line of text at the click index
-            line = self.file_tree_text.get("%s linestart" % index, "%s lineend" % index)
-            # Extract the file path from the line of text
-            file_path = line.strip("├── \n")
-            # Construct the full path to the clicked file
-            clicked_file = self.current_directory / file_path
+            row_index = self.clicked_row(event)
+            if row_index is None:
+                return
+            clicked_file = Path(self.tree_model.rows[row_index].path)
             if clicked_file.is_file():
-                with clicked_file.open('r') as f:
-                    content = f.read()
-                self.file_preview_text.delete(1.0, "end")
-                self.file_preview_text.insert("end", content)
+                self.open_in_viewer(clicked_file)
         except Exception as e:
             print("Error:", str(e))
             tk.messagebox.showerror("Error", f"An error occurred: {str(e)}")
@@ -214,40 +195,242 @@ class TextSearchGUI(tk.Tk):
             path = Path(directory)
             if path.exists() and path.is_dir():
                 self.current_directory = path
-                self.expanded_dirs = set()
                 self.build_file_tree(self.current_directory)
+                self.start_indexing(self.current_directory)
             else:
                 messagebox.showerror("Error", "Directory not found or not a directory.")
   
   ### SEARCHING ###
   
-    def perform_search(self, event):
+    def perform_search(self, event=None):
+        self.search_after = None
         query = self.search_var.get()
-        results = self.searcher.search(query)  # Perform the search using the ScrollSearch class
-        self.display_results(results)
-
-    def display_results(self, results):
+        # a new search replaces the one that is running
+        self.search_cancel.set()
+        self.search_id += 1
         self.results_listbox.delete(0, "end")
-        for file, preview in results:
-            self.results_listbox.insert("end", file)
+        if not query.strip():
+            return
+        if self.searcher is None:
+            self.status_var.set("Still indexing, search again when it is done")
+            return
+        self.search_cancel = threading.Event()
+        self.status_var.set("Searching...")
+        threading.Thread(target=self.search_worker, args=(self.search_id, self.searcher, query, self.search_cancel),
+                         daemon=True).start()
+
+    #search-as-you-type: waits for a pause in typing before searching
+    def schedule_search(self, event):
+        if event.keysym == "Return":
+            return
+        self.search_cancel.set()
+        if self.search_after is not None:
+            self.after_cancel(self.search_after)
+        self.search_after = self.after(SEARCH_DELAY_MS, self.perform_search)
+
+  ### BACKGROUND WORK ###
+
+    #builds the index of a directory in a worker thread, the window stays usable meanwhile
+    def start_indexing(self, directory):
+        if self.watcher is not None:
+            # stop joins the watcher thread, which may be in the middle of a long index update
+            threading.Thread(target=self.watcher.stop, daemon=True).start()
+            self.watcher = None
+        self.searcher = None
+        self.search_cancel.set()
+        self.index_id += 1
+        self.progress.configure(value=0, maximum=1)
+        self.status_var.set("Indexing...")
+        threading.Thread(target=self.index_worker, args=(self.index_id, directory), daemon=True).start()
+
+    def index_worker(self, index_id, directory):
+        def progress(done, total):
+            self.events.put(("progress", index_id, done, total))
+        try:
+            searcher = ScrollSearch(str(directory), progress=progress)
+        except Exception as e:
+            self.events.put(("index_error", index_id, str(e)))
+            return
+        self.events.put(("indexed", index_id, searcher))
+
+    def search_worker(self, search_id, searcher, query, cancel):
+        count = 0
+        try:
+            # the list only shows paths, so the hits are ranked without building their previews
+            for file, _ in searcher.rank(query, limit=RESULT_LIMIT):
+                if cancel.is_set():
+                    return
+                self.events.put(("result", search_id, file))
+                count += 1
+        except Exception as e:
+            self.events.put(("search_error", search_id, str(e)))
+            return
+        if not cancel.is_set():
+            self.events.put(("searched", search_id, count))
+
+    #Tk is not thread safe, so the worker threads only queue messages and this handles them on the Tk thread
+    def process_events(self):
+        try:
+            while True:
+                kind, job_id, *args = self.events.get_nowait()
+                self.handle_event(kind, job_id, *args)
+        except queue.Empty:
+            pass
+        self.after(GUI_POLL_MS, self.process_events)
+
+    def handle_event(self, kind, job_id, *args):
+        if kind in ("progress", "indexed", "index_error") and job_id != self.index_id:
+            return
+        if kind in ("result", "searched", "search_error") and job_id != self.search_id:
+            return
+        if kind in ("located", "locate_error") and job_id != self.locate_id:
+            return
+
+        if kind == "progress":
+            done, total = args
+            self.progress.configure(value=done, maximum=max(total, 1))
+            self.status_var.set(f"Indexing {done}/{total} files...")
+        elif kind == "indexed":
+            self.searcher = args[0]
+            self.progress.configure(value=1, maximum=1)
+            self.status_var.set(f"Indexed {len(self.searcher.doc_ids)} files")
+            self.watcher = IndexWatcher(self.searcher, on_update=self.on_index_update)
+            self.watcher.start()
+            if self.search_var.get().strip():
+                self.perform_search()
+        elif kind == "updated":
+            changed, removed = args
+            self.status_var.set(f"Index updated: {changed} files changed, {removed} removed")
+        elif kind == "result":
+            self.results_listbox.insert("end", args[0])
+        elif kind == "searched":
+            self.status_var.set(f"{args[0]} results")
+        elif kind == "located":
+            path, offset, terms = args
+            self.status_var.set("")
+            try:
+                self.open_in_viewer(path, offset or 0, terms)
+            except Exception as e:
+                print("Error:", str(e))
+                messagebox.showerror("Error", f"An error occurred: {str(e)}")
+        elif kind in ("index_error", "search_error", "locate_error"):
+            self.status_var.set("")
+            messagebox.showerror("Error", f"An error occurred: {args[0]}")
+
+    #called from the watcher thread
+    def on_index_update(self, changed, removed):
+        self.events.put(("updated", None, changed, removed))
 
     def on_result_select(self, event):
         selected_index = self.results_listbox.curselection()
-        if selected_index:
+        if selected_index and self.searcher is not None:
             selected_file = self.results_listbox.get(selected_index)
-            content = self.searcher.files[selected_file]
-            query = self.search_var.get()
-        
-            # Use _get_preview to generate a context-aware preview
-            preview = self.searcher._get_preview(content, self.searcher.tokenize(query))
-            
-            self.file_preview_text.delete(1.0, "end")
-            self.file_preview_text.insert("end", preview)
+            self.locate_id += 1
+            self.status_var.set(f"Opening {Path(selected_file).name}...")
+            # finding the match can mean scanning a large file, so it is done off the Tk thread
+            threading.Thread(target=self.locate_worker, daemon=True,
+                             args=(self.locate_id, self.searcher, selected_file, self.search_var.get())).start()
+
+    def locate_worker(self, locate_id, searcher, path, query):
+        try:
+            terms = searcher.query_terms(query)
+            # open the file right at the first match instead of at the top
+            offset = searcher.documents.find(path, terms) if terms else None
+        except Exception as e:
+            self.events.put(("locate_error", locate_id, str(e)))
+            return
+        self.events.put(("located", locate_id, path, offset, terms))
+
+  ### FILE VIEWER ###
+
+    #shows a file in the preview box, only a few chunks around the part that is on screen are ever loaded
+    def open_in_viewer(self, path, offset=0, terms=()):
+        self.close_viewer()
+        self.viewer = FileWindow(str(path))
+        self.viewer_terms = list(terms)
+        start, end = self.viewer.chunk_around(offset)
+        text = self.viewer.read(start, end)
+        self.viewer_chunks = deque([(start, end, len(text))])
+        self.file_preview_text.delete(1.0, "end")
+        self.file_preview_text.insert("end", text)
+        # the offset is this many characters into the chunk
+        self.file_preview_text.see(f"1.0 + {len(self.viewer.read(start, offset))} chars")
+        self.check_viewer_window()
+
+    def close_viewer(self):
+        if self.viewer is not None:
+            self.viewer.close()
+            self.viewer = None
+        self.viewer_chunks.clear()
+
+    def on_preview_scroll(self, first, last):
+        self.file_preview_text.vbar.set(first, last)
+        if self.viewer is not None and self.viewer_check is None:
+            self.viewer_check = self.after_idle(self.check_viewer_window)
+
+    #loads the next or previous chunk once the view gets close to an end of what is loaded
+    def check_viewer_window(self):
+        self.viewer_check = None
+        if self.viewer is None:
+            return
+        first, last = self.file_preview_text.yview()
+        if last > 0.9 and self.viewer_chunks[-1][1] < self.viewer.size:
+            self.load_next_chunk()
+        elif first < 0.1 and self.viewer_chunks[0][0] > 0:
+            self.load_previous_chunk()
+        self.highlight_visible()
+
+    def load_next_chunk(self):
+        start = self.viewer_chunks[-1][1]
+        end = self.viewer.chunk_end(start)
+        text = self.viewer.read(start, end)
+        # a mark moves with the text, so the view can be put back where it was
+        self.file_preview_text.mark_set("viewtop", "@0,0")
+        self.file_preview_text.insert("end - 1 chars", text)
+        self.viewer_chunks.append((start, end, len(text)))
+        if len(self.viewer_chunks) > VIEWER_MAX_CHUNKS:
+            _, _, length = self.viewer_chunks.popleft()
+            self.file_preview_text.delete("1.0", f"1.0 + {length} chars")
+        self.file_preview_text.yview("viewtop")
+
+    def load_previous_chunk(self):
+        start, end = self.viewer.chunk_before(self.viewer_chunks[0][0])
+        text = self.viewer.read(start, end)
+        self.file_preview_text.mark_set("viewtop", "@0,0")
+        self.file_preview_text.insert("1.0", text)
+        self.viewer_chunks.appendleft((start, end, len(text)))
+        if len(self.viewer_chunks) > VIEWER_MAX_CHUNKS:
+            _, _, length = self.viewer_chunks.pop()
+            self.file_preview_text.delete(f"end - {length + 1} chars", "end - 1 chars")
+        self.file_preview_text.yview("viewtop")
+
+    #highlights the search terms, only in the lines that are on screen
+    def highlight_visible(self):
+        widget = self.file_preview_text
+        widget.tag_remove("match", "1.0", "end")
+        if not self.viewer_terms:
+            return
+        first = widget.index("@0,0")
+        last = widget.index(f"@0,{widget.winfo_height()} lineend")
+        pattern = "|".join(re.escape(term) for term in self.viewer_terms)
+        count = tk.IntVar()
+        index = first
+        while True:
+            index = widget.search(pattern, index, stopindex=last, regexp=True, nocase=True, count=count)
+            if not index or not count.get():
+                break
+            end = f"{index} + {count.get()} chars"
+            widget.tag_add("match", index, end)
+            index = end
 
 
 def main():
     app = TextSearchGUI()
     app.mainloop()
+    app.search_cancel.set()
+    app.close_viewer()
+    if app.watcher is not None:
+        app.watcher.stop()
 
 if __name__ == "__main__":
     main()
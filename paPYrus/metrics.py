@@ -0,0 +1,208 @@
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Optional
+
+
+class _Stage:
+    """
+    Times a block and records it under a stage name.
+    """
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """
+    Collects per-stage timers and counters of a ScrollSearch, and optionally cProfile statistics.
+
+    Hooks are called with (kind, name, value) for every recorded stage ("stage", name, seconds) and counter
+    ("count", name, amount), for example to forward them to a monitoring system.
+    """
+    enabled = True
+
+    def __init__(self, profile: bool = False, hooks=()):
+        """
+        Initializes the Metrics object.
+
+        :param profile: If True, build_index and searches run under cProfile and their statistics are kept.
+        :param hooks: Callables that are called with (kind, name, value) for every stage and counter.
+        """
+        self.profiling = profile
+        self.hooks = list(hooks)
+        self.timers: Dict[str, list] = {}  # stage -> [calls, total seconds, longest seconds]
+        self.counters: Dict[str, int] = {}
+        self.profiles: Dict[str, pstats.Stats] = {}  # profiled operation -> accumulated statistics
+        self.lock = threading.Lock()  # stages are recorded from the GUI, search and watcher threads
+
+    def add_hook(self, hook: Callable[[str, str, float], None]):
+        """
+        Registers a callable that is called with (kind, name, value) for every stage and counter.
+
+        :param hook: The callable.
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[str, str, float], None]):
+        """
+        Unregisters a hook.
+
+        :param hook: A callable given to add_hook or the constructor.
+        """
+        self.hooks.remove(hook)
+
+    def stage(self, name: str) -> _Stage:
+        """
+        Returns a context manager that records the time spent in its block.
+
+        :param name: The name of the stage.
+        """
+        return _Stage(self, name)
+
+    def record(self, name: str, seconds: float):
+        """
+        Records one run of a stage.
+
+        :param name: The name of the stage.
+        :param seconds: How long it took.
+        """
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+        for hook in self.hooks:
+            hook("stage", name, seconds)
+
+    def count(self, name: str, amount: int = 1):
+        """
+        Adds to a counter.
+
+        :param name: The name of the counter.
+        :param amount: How much to add.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        for hook in self.hooks:
+            hook("count", name, amount)
+
+    @contextmanager
+    def profile(self, name: str):
+        """
+        Runs a block under cProfile if profiling is on, adding its statistics to those kept under name.
+        Blocks nested in a profiled block, or running while another thread profiles, are not profiled separately.
+
+        :param name: The name of the profiled operation.
+        """
+        if not self.profiling:
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is already running
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self.lock:
+                if name in self.profiles:
+                    self.profiles[name].add(profiler)
+                else:
+                    self.profiles[name] = pstats.Stats(profiler)
+
+    def profile_report(self, name: str, sort: str = "cumulative", limit: int = 30) -> Optional[str]:
+        """
+        Formats the cProfile statistics of an operation.
+
+        :param name: The name of the profiled operation, e.g. "build_index" or "search".
+        :param sort: The pstats sort key.
+        :param limit: How many functions to list.
+        :return: The report, or None if the operation was not profiled.
+        """
+        with self.lock:
+            stats = self.profiles.get(name)
+            if stats is None:
+                return None
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current timers and counters.
+
+        :return: A JSON serializable dictionary with "timers", mapping each stage to its calls, total seconds, mean
+            and longest time in milliseconds, and "counters".
+        """
+        with self.lock:
+            timers = {
+                name: {"calls": calls, "seconds": seconds, "mean_ms": 1000 * seconds / calls, "max_ms": 1000 * longest}
+                for name, (calls, seconds, longest) in self.timers.items()
+            }
+            return {"timers": timers, "counters": dict(self.counters), "profiled": sorted(self.profiles)}
+
+    def dump(self, path: str, extra: Optional[dict] = None):
+        """
+        Writes a snapshot to a JSON file.
+
+        :param path: The file to write.
+        :param extra: More entries to add to the snapshot.
+        """
+        snapshot = self.snapshot()
+        snapshot.update(extra or {})
+        with open(path, "w") as f:
+            json.dump(snapshot, f, indent=2)
+
+    def reset(self):
+        """
+        Clears all timers, counters and profiles.
+        """
+        with self.lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.profiles.clear()
+
+
+class NullMetrics:
+    """
+    Stands in for Metrics when metrics are off, doing nothing as cheaply as possible.
+    """
+    enabled = False
+    _null = nullcontext()
+
+    def stage(self, name: str):
+        return self._null
+
+    def profile(self, name: str):
+        return self._null
+
+    def record(self, name: str, seconds: float):
+        pass
+
+    def count(self, name: str, amount: int = 1):
+        pass
+
+    def snapshot(self) -> dict:
+        return {"timers": {}, "counters": {}, "profiled": []}
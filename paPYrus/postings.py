@@ -0,0 +1,240 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from typing import Iterable, List
+
+
+def encode_positions(positions, out: bytearray):
+    """
+    Appends ascending token positions to a buffer as varint encoded gaps.
+
+    :param positions: The ascending positions of a token in one document.
+    :param out: The buffer to append to.
+    """
+    previous = 0
+    for position in positions:
+        gap = position - previous
+        previous = position
+        while gap >= 0x80:
+            out.append((gap & 0x7F) | 0x80)
+            gap >>= 7
+        out.append(gap)
+
+
+def decode_positions(data, start: int, count: int) -> List[int]:
+    """
+    Decodes positions written by encode_positions.
+
+    :param data: The buffer holding the encoded positions.
+    :param start: The offset of the first byte of the document's positions.
+    :param count: How many positions to decode.
+    :return: The list of positions.
+    """
+    positions = []
+    position = 0
+    i = start
+    for _ in range(count):
+        gap = 0
+        shift = 0
+        while True:
+            byte = data[i]
+            i += 1
+            gap |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        position += gap
+        positions.append(position)
+    return positions
+
+
+class PostingList:
+    """
+    The postings of one term: the sorted ids of the documents containing it, the term frequency in each of them and
+    the varint encoded positions of every occurrence.
+    """
+    __slots__ = ("doc_ids", "freqs", "offsets", "positions")
+
+    def __init__(self):
+        self.doc_ids = array('I')  # ascending document ids
+        self.freqs = array('I')  # number of occurrences of the term in each document
+        self.offsets = array('I')  # where the positions of each document start in self.positions
+        self.positions = bytearray()
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __getstate__(self):
+        # raw bytes pickle far smaller than arrays, which matters with one list per term
+        return self.doc_ids.tobytes(), self.freqs.tobytes(), self.offsets.tobytes(), bytes(self.positions)
+
+    def __setstate__(self, state):
+        self.doc_ids, self.freqs, self.offsets = array('I'), array('I'), array('I')
+        self.doc_ids.frombytes(state[0])
+        self.freqs.frombytes(state[1])
+        self.offsets.frombytes(state[2])
+        self.positions = bytearray(state[3])
+
+    def add(self, doc_id: int, positions):
+        """
+        Appends a document to the list.
+
+        :param doc_id: The id of the document, greater than every id already in the list.
+        :param positions: The ascending positions of the term in the document.
+        """
+        if self.doc_ids and doc_id <= self.doc_ids[-1]:
+            raise ValueError("Documents must be added in ascending id order.")
+        self.doc_ids.append(doc_id)
+        self.freqs.append(len(positions))
+        self.offsets.append(len(self.positions))
+        encode_positions(positions, self.positions)
+
+    def extend(self, other: "PostingList"):
+        """
+        Appends all documents of another list whose ids are all greater than the ones in this list.
+
+        :param other: The list to append.
+        """
+        if not other.doc_ids:
+            return
+        if self.doc_ids and other.doc_ids[0] <= self.doc_ids[-1]:
+            raise ValueError("Documents must be added in ascending id order.")
+        base = len(self.positions)
+        self.doc_ids.extend(other.doc_ids)
+        self.freqs.extend(other.freqs)
+        self.offsets.extend(offset + base for offset in other.offsets)
+        self.positions.extend(other.positions)
+
+    def remove(self, doc_id: int) -> bool:
+        """
+        Removes a document from the list.
+
+        :param doc_id: The id of the document.
+        :return: True if the document was in the list.
+        """
+        return self.remove_many((doc_id,)) == 1
+
+    def remove_many(self, doc_ids) -> int:
+        """
+        Removes several documents at once. The list is rebuilt once from slices of the runs of documents that are
+        kept, instead of moving its tail once per removed document.
+
+        :param doc_ids: The ids of the documents, in any order.
+        :return: How many of them were in the list.
+        """
+        drop = sorted({i for i in map(self.find, doc_ids) if i >= 0})
+        if not drop:
+            return 0
+        count = len(self.doc_ids)
+        doc_ids, freqs, offsets, positions = array('I'), array('I'), array('I'), bytearray()
+        start = 0
+        for end in drop + [count]:
+            if start < end:
+                first = self.offsets[start]
+                last = self.offsets[end] if end < count else len(self.positions)
+                doc_ids += self.doc_ids[start:end]
+                freqs += self.freqs[start:end]
+                # the positions of the run move to the end of the ones kept so far
+                shift = len(positions) - first
+                if shift:
+                    offsets.extend(map(shift.__add__, self.offsets[start:end]))
+                else:
+                    offsets += self.offsets[start:end]
+                positions += self.positions[first:last]
+            start = end + 1
+        self.doc_ids, self.freqs, self.offsets, self.positions = doc_ids, freqs, offsets, positions
+        return len(drop)
+
+    def find(self, doc_id: int, lo: int = 0) -> int:
+        """
+        Looks up the index of a document in the list.
+
+        :param doc_id: The id of the document.
+        :param lo: Index to start looking from.
+        :return: The index of the document, or -1 if it is not in the list.
+        """
+        i = bisect_left(self.doc_ids, doc_id, lo)
+        if i < len(self.doc_ids) and self.doc_ids[i] == doc_id:
+            return i
+        return -1
+
+    def positions_at(self, i: int) -> List[int]:
+        """
+        Returns the positions of the term in the document at index i of the list.
+
+        :param i: The index of the document in the list.
+        :return: The ascending positions of the term.
+        """
+        return decode_positions(self.positions, self.offsets[i], self.freqs[i])
+
+
+def intersect(lists: Iterable[PostingList]) -> List[int]:
+    """
+    Intersects posting lists, starting from the shortest one and skipping through the longer ones by binary search.
+
+    :param lists: The posting lists.
+    :return: The ascending ids of the documents that are in every list.
+    """
+    lists = sorted(lists, key=len)
+    if not lists:
+        return []
+    results = list(lists[0].doc_ids)
+    for posting in lists[1:]:
+        if not results:
+            break
+        doc_ids = posting.doc_ids
+        matched = []
+        lo = 0
+        for doc_id in results:
+            lo = bisect_left(doc_ids, doc_id, lo)
+            if lo == len(doc_ids):
+                break
+            if doc_ids[lo] == doc_id:
+                matched.append(doc_id)
+        results = matched
+    return results
+
+
+def union(lists: Iterable[PostingList]) -> List[int]:
+    """
+    Merges posting lists.
+
+    :param lists: The posting lists.
+    :return: The ascending ids of the documents that are in any of the lists.
+    """
+    lists = [posting.doc_ids for posting in lists if posting.doc_ids]
+    if len(lists) == 1:
+        return list(lists[0])
+    results = []
+    last = -1
+    for doc_id in heapq.merge(*lists):
+        if doc_id != last:
+            results.append(doc_id)
+            last = doc_id
+    return results
+
+
+def merge(lists: Iterable[PostingList]) -> PostingList:
+    """
+    Combines the posting lists of several terms into one, as if they were all the same term. Used for the terms a
+    wildcard or fuzzy query term expands to.
+
+    :param lists: The posting lists.
+    :return: A new list holding every document of the lists with the summed frequencies and all positions.
+    """
+    lists = [posting for posting in lists if posting]
+    if len(lists) == 1:
+        return lists[0]
+    merged = PostingList()
+    cursors = [0] * len(lists)
+    for doc_id in union(lists):
+        positions = []
+        for i, posting in enumerate(lists):
+            j = posting.find(doc_id, cursors[i])
+            if j >= 0:
+                cursors[i] = j + 1
+                positions.extend(posting.positions_at(j))
+        # a position holds one token, so the positions of different terms never collide
+        positions.sort()
+        merged.add(doc_id, positions)
+    return merged
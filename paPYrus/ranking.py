@@ -0,0 +1,172 @@
+import heapq
+import math
+from bisect import bisect_left
+from typing import List, Optional, Sequence, Tuple
+
+from .config import *
+from .postings import PostingList
+
+
+class BM25:
+    """
+    Scores documents for a query with Okapi BM25 and picks the best ones.
+    """
+
+    def __init__(self, doc_lengths, doc_count: int, total_length: int, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Initializes the BM25 object with the statistics of the index.
+
+        :param doc_lengths: doc id -> number of tokens in the document.
+        :param doc_count: Number of documents in the index.
+        :param total_length: Number of tokens in all documents.
+        :param k1: Term frequency saturation.
+        :param b: Document length normalization.
+        """
+        self.doc_lengths = doc_lengths
+        self.doc_count = doc_count
+        self.k1 = k1
+        self.b = b
+        self.avg_length = total_length / doc_count if doc_count else 0.0
+
+    def idf(self, posting: PostingList) -> float:
+        """
+        Returns the inverse document frequency of a term, which is never negative.
+
+        :param posting: The posting list of the term.
+        :return: The weight of the term.
+        """
+        df = len(posting)
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def _norm(self, doc_id: int) -> float:
+        # the document length part of the BM25 denominator
+        if not self.avg_length:
+            return self.k1
+        return self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+
+    def rank(self, postings: Sequence[PostingList], doc_ids: Sequence[int],
+             limit: Optional[int] = None) -> List[Tuple[float, int]]:
+        """
+        Scores a known set of candidate documents, for example the matches of a phrase.
+
+        :param postings: The posting lists of the query terms.
+        :param doc_ids: The ascending ids of the candidates.
+        :param limit: How many of the best documents to return, or None for all of them.
+        :return: (score, doc_id) pairs, best first.
+        """
+        weights = [self.idf(posting) for posting in postings]
+        cursors = [0] * len(postings)
+        k1 = self.k1 + 1
+        scored = []
+        for doc_id in doc_ids:
+            norm = self._norm(doc_id)
+            parts = []
+            for i, posting in enumerate(postings):
+                j = bisect_left(posting.doc_ids, doc_id, cursors[i])
+                cursors[i] = j
+                if j < len(posting.doc_ids) and posting.doc_ids[j] == doc_id:
+                    tf = posting.freqs[j]
+                    parts.append(weights[i] * tf * k1 / (tf + norm))
+            scored.append((math.fsum(parts), doc_id))
+        return _best(scored, limit)
+
+    def top_k(self, postings: Sequence[PostingList], limit: Optional[int]) -> List[Tuple[float, int]]:
+        """
+        Finds the best documents containing any of the query terms.
+
+        Uses MaxScore: once k documents have been seen, terms whose summed score bounds cannot beat the k-th best
+        score are no longer walked, they are only looked up for documents found through the other terms.
+
+        :param postings: The posting lists of the query terms.
+        :param limit: How many of the best documents to return, or None for all of them.
+        :return: (score, doc_id) pairs, best first.
+        """
+        postings = [posting for posting in postings if posting]
+        if not postings or (limit is not None and limit <= 0):
+            return []
+        if limit is None:
+            return self._exhaustive(postings)
+
+        k1 = self.k1 + 1
+        weights = [self.idf(posting) for posting in postings]
+        # the term frequency part of a score is below k1 + 1, so weight * (k1 + 1) bounds a term's contribution
+        order = sorted(range(len(postings)), key=lambda i: weights[i])
+        postings = [postings[i] for i in order]
+        weights = [weights[i] for i in order]
+        bounds = [weight * k1 for weight in weights]
+        prefix = [0.0]
+        for bound in bounds:
+            prefix.append(prefix[-1] + bound)
+
+        heap = []  # (score, -doc_id) of the best documents so far, worst on top
+        threshold = 0.0
+        first_essential = 0  # terms before this one cannot lift a document above the threshold on their own
+        cursors = [0] * len(postings)
+        ends = [len(posting.doc_ids) for posting in postings]
+        while True:
+            essential = range(first_essential, len(postings))
+            doc_id = min((postings[i].doc_ids[cursors[i]] for i in essential if cursors[i] < ends[i]), default=None)
+            if doc_id is None:
+                break
+            norm = self._norm(doc_id)
+            parts = []
+            for i in essential:
+                j = cursors[i]
+                if j < ends[i] and postings[i].doc_ids[j] == doc_id:
+                    tf = postings[i].freqs[j]
+                    parts.append(weights[i] * tf * k1 / (tf + norm))
+                    cursors[i] = j + 1
+            score = sum(parts)
+            # add the non-essential terms, biggest first, while they can still make a difference
+            for i in range(first_essential - 1, -1, -1):
+                if score + prefix[i + 1] <= threshold:
+                    break
+                j = bisect_left(postings[i].doc_ids, doc_id, cursors[i])
+                cursors[i] = j
+                if j < ends[i] and postings[i].doc_ids[j] == doc_id:
+                    tf = postings[i].freqs[j]
+                    parts.append(weights[i] * tf * k1 / (tf + norm))
+                    score += parts[-1]
+
+            # fsum is exact, so a score does not depend on the order its parts were found in
+            score = math.fsum(parts)
+            if len(heap) < limit:
+                heapq.heappush(heap, (score, -doc_id))
+            elif score > threshold:
+                heapq.heapreplace(heap, (score, -doc_id))
+            else:
+                continue
+            if len(heap) == limit:
+                threshold = heap[0][0]
+                while first_essential < len(postings) and prefix[first_essential + 1] <= threshold:
+                    first_essential += 1
+        return sorted(((score, -doc_id) for score, doc_id in heap), key=lambda hit: (-hit[0], hit[1]))
+
+    def _exhaustive(self, postings: Sequence[PostingList]) -> List[Tuple[float, int]]:
+        """
+        Scores every document containing any of the query terms, term by term.
+
+        :param postings: The posting lists of the query terms.
+        :return: (score, doc_id) pairs, best first.
+        """
+        k1 = self.k1 + 1
+        scores = {}
+        for posting in postings:
+            weight = self.idf(posting)
+            for doc_id, tf in zip(posting.doc_ids, posting.freqs):
+                scores.setdefault(doc_id, []).append(weight * tf * k1 / (tf + self._norm(doc_id)))
+        return _best([(math.fsum(parts), doc_id) for doc_id, parts in scores.items()], None)
+
+
+def _best(scored: List[Tuple[float, int]], limit: Optional[int]) -> List[Tuple[float, int]]:
+    """
+    Orders (score, doc_id) pairs best first, breaking ties by ascending doc id.
+
+    :param scored: The scored documents.
+    :param limit: How many to keep, or None for all of them.
+    :return: The best pairs.
+    """
+    key = lambda hit: (-hit[0], hit[1])
+    if limit is None:
+        return sorted(scored, key=key)
+    return heapq.nsmallest(limit, scored, key=key)
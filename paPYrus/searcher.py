@@ -1,124 +1,781 @@
+import hashlib
+import heapq
 import os
-import string
-from collections import defaultdict
-from nltk.stem import PorterStemmer
+import pickle
+import sys
+import tempfile
+import threading
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
+from .analyzer import Analyzer
+from .cache import LRUCache
 from .config import *
+from .metrics import Metrics, NullMetrics
+from .postings import PostingList, intersect, merge
+from .ranking import BM25
+from .storage import DocumentStore
+from .terms import TermDictionary, is_pattern, parse_pattern
 
 
+_worker_analyzer = None  # The analyzer of an index build worker process
+
+
+def _sizeof_hits(hits):
+    """
+    Estimates the memory taken by a cached ranking. The paths are shared with the index and not counted.
+    
+    :param hits: A list of (path, score) tuples.
+    :return: The estimated size in bytes.
+    """
+    return sys.getsizeof(hits) + 80 * len(hits)
+
+
+def _init_worker(analyzer):
+    """
+    Sets up an index build worker process.
+    
+    :param analyzer: The analyzer of the ScrollSearch that started the build.
+    """
+    global _worker_analyzer
+    _worker_analyzer = analyzer
+
+
+def _index_chunk(docs, analyzer=None):
+    """
+    Reads and tokenizes a chunk of files, either in-process or in an index build worker process.
+    
+    :param docs: The (doc_id, path) pairs of the chunk, in ascending id order.
+    :param analyzer: The analyzer to use. Worker processes leave it out and use the one they were set up with.
+    :return: A tuple (partial_index, doc_terms, doc_lengths, errors) where partial_index maps each token to the
+        PostingList of the chunk, doc_terms maps the ids of the files that could be read to their distinct tokens
+        and doc_lengths maps them to their number of tokens.
+    """
+    if analyzer is None:
+        analyzer = _worker_analyzer
+    partial_index = {}
+    doc_terms = {}
+    doc_lengths = {}
+    errors = []
+    for doc_id, path in docs:
+        positions = {}
+        try:
+            with open(path, 'r') as f:
+                for position, token in analyzer.stream_positions(f):
+                    token_positions = positions.get(token)
+                    if token_positions is None:
+                        positions[token] = [position]
+                    else:
+                        token_positions.append(position)
+        except Exception as e:
+            errors.append(f"Could not read file {path}: {str(e)}")
+            continue
+        for token, token_positions in positions.items():
+            posting = partial_index.get(token)
+            if posting is None:
+                posting = partial_index[token] = PostingList()
+            posting.add(doc_id, token_positions)
+        doc_terms[doc_id] = tuple(positions)
+        doc_lengths[doc_id] = sum(len(token_positions) for token_positions in positions.values())
+    return partial_index, doc_terms, doc_lengths, errors
+
 
 class ScrollSearch:
-    def __init__(self, directory: str):
+    def __init__(self, directory: str, index_path: Optional[str] = None, persist: bool = True,
+                 workers: int = INDEX_WORKERS, analyzer: Optional[Analyzer] = None,
+                 progress: Optional[Callable[[int, int], None]] = None, metrics: Optional[Metrics] = None,
+                 shard: Optional[Tuple[int, int]] = None):
         """
         Initializes the ScrollSearch object.
         
         :param directory: The directory containing text files to be searched.
+        :param index_path: Where to keep the on-disk index. Defaults to a file under INDEX_DIR named after the directory.
+        :param persist: If False, the index is built in memory only and never loaded from or saved to disk. It is
+            also not persisted if the analyzer has no signature.
+        :param workers: Number of processes used to build the index. 1 builds serially, 0 uses every core.
+        :param analyzer: Turns file contents and queries into tokens. Defaults to Porter stemming without stopwords.
+        :param progress: Called with (files_done, files_total) while the initial index build reads files.
+        :param metrics: Records stage timings and counters of indexing and searching. Off by default.
+        :param shard: A tuple (index, count) to only index the files of the directory that hash to shard index of
+            count, see ShardedSearch. None indexes every file.
         """
-        self.directory = Path(directory)
+        # resolved, so the stored paths and the saved index are the same however the directory is spelled
+        self.directory = Path(directory).resolve()
         if not self.directory.exists() or not self.directory.is_dir():
             raise ValueError("Provided path is not a valid directory.")
-        self.inverted_index = defaultdict(list)  # A dictionary to store the inverted index
-        self.files = {}  # A dictionary to store the content of each file
-        self.stemmer = PorterStemmer()  # The stemmer used for token normalization
-        self.build_index()
+        self.inverted_index = {}  # token -> PostingList of the documents containing it
+        self.doc_paths = []  # doc id -> path, None for ids of removed or unreadable files
+        self.doc_ids = {}  # path -> doc id
+        self.doc_terms = {}  # doc id -> the distinct tokens of the document, used to remove it from the index
+        self.doc_lengths = array('I')  # doc id -> number of tokens in the document, used for ranking
+        self.total_length = 0  # number of tokens in all documents
+        self.file_meta = {}  # path -> (mtime_ns, size) of each file at the time it was indexed
+        self.terms = TermDictionary()  # The sorted tokens of the index, for wildcard and fuzzy query terms
+        self.documents = DocumentStore()  # Reads the text of the files on demand
+        self.generation = 0  # Goes up on every change to the index, so cached search results can't go stale
+        self.query_cache = LRUCache(max_entries=QUERY_CACHE_ENTRIES)  # query -> analyzed tokens and positions
+        self.result_cache = LRUCache(max_bytes=RESULT_CACHE_BYTES, sizeof=_sizeof_hits)  # query -> ranked hits
+        self.preview_cache = LRUCache(max_bytes=PREVIEW_CACHE_BYTES)  # (path, tokens) -> preview
+        self.lock = threading.RLock()  # Held while the index is changed or searched, e.g. by an IndexWatcher
+        self.analyzer = analyzer or Analyzer()  # Tokenizes and normalizes file contents and queries
+        self.metrics = metrics or NullMetrics()  # Stage timers and counters, does nothing unless enabled
+        self.shard = tuple(shard) if shard else None
+        # the saved index of an analyzer without a signature could be mistaken for that of another one
+        self.persist = persist and self.analyzer.signature() is not None
+        self.workers = workers
+        self.index_path = Path(index_path) if index_path else self.default_index_path(self.directory, self.shard)
+        if self.persist:
+            self.load_index()
+        self.build_index(progress=progress)
 
-    def build_index(self):
+    @staticmethod
+    def default_index_path(directory, shard: Optional[Tuple[int, int]] = None) -> Path:
         """
-        Builds the inverted index from the text files in the specified directory.
+        Returns the default location of the saved index for a directory.
+        
+        :param directory: The indexed directory.
+        :param shard: The (index, count) of the shard of the directory, or None for all of it.
+        :return: A path under INDEX_DIR unique to the resolved directory and shard.
+        """
+        key = hashlib.sha1(str(Path(directory).resolve()).encode("utf-8")).hexdigest()
+        if shard:
+            key += f"-{shard[0]}of{shard[1]}"
+        return Path(INDEX_DIR) / f"{key}.idx"
+
+    def _in_shard(self, path: str) -> bool:
+        """
+        Tells whether a file belongs to the shard of this index.
+        
+        :param path: The path of a file in the directory.
+        :return: True if the file is indexed here.
         """
-        for file_path in self.directory.rglob('*.txt'):
-            if file_path.is_file() and file_path.suffix.lower() in FILE_TYPES:
+        if self.shard is None:
+            return True
+        # crc32 of the relative path is stable across runs and machines, unlike hash()
+        relative = os.path.relpath(path, self.directory)
+        return zlib.crc32(os.fsencode(relative)) % self.shard[1] == self.shard[0]
+
+    def _scan_files(self, top: Optional[str] = None) -> Dict[str, Tuple[int, int]]:
+        """
+        Walks the directory and collects the files that should be indexed. Hidden directories are skipped.
+        
+        :param top: A directory inside the indexed directory to scan instead of all of it.
+        :return: A manifest mapping each file path to its (mtime_ns, size).
+        """
+        manifest = {}
+        for root, dirs, names in os.walk(self.directory if top is None else top):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(names):
+                if os.path.splitext(name)[1].lower() not in FILE_TYPES:
+                    continue
+                file_path = os.path.join(root, name)
+                if not self._in_shard(file_path):
+                    continue
                 try:
-                    
-                    with file_path.open('r') as f:  # Updated to open the file using the Path object
-                        content = f.read()
-                except Exception as e:
-                    print(f"Could not read file {file_path}: {str(e)}")
+                    stat = os.stat(file_path)
+                except OSError:
                     continue
-                
-                tokens = self.tokenize(content)
-                for token in tokens:
-                    # Updated to convert the Path object to a string before adding it to the index
-                    self.inverted_index[token].append(str(file_path))  
-                # Updated to convert the Path object to a string before using it as a key
-                self.files[str(file_path)] = content
+                manifest[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return manifest
+
+    def build_index(self, full: bool = False, workers: Optional[int] = None,
+                    progress: Optional[Callable[[int, int], None]] = None):
+        """
+        Builds the inverted index from the text files in the specified directory.
+        
+        Only files that were added, changed or deleted since the last build are re-tokenized, so calling this
+        on an index loaded from disk only costs a directory scan when nothing changed.
+        
+        :param full: If True, throws away the current index and re-reads every file.
+        :param workers: Overrides the number of build processes given to the constructor for this call.
+        :param progress: Called with (files_done, files_total) as files are read.
+        :return: A tuple (added_or_changed, removed) with the number of files that were re-indexed and dropped.
+        """
+        with self.lock, self.metrics.profile("build_index"), self.metrics.stage("build_index"):
+            return self._build_index(full, workers, progress)
+
+    def _build_index(self, full: bool, workers: Optional[int], progress: Optional[Callable[[int, int], None]]):
+        """
+        Does the work of build_index while the lock is held.
+        """
+        if full:
+            self.inverted_index = {}
+            self.doc_paths = []
+            self.doc_ids = {}
+            self.doc_terms = {}
+            self.doc_lengths = array('I')
+            self.total_length = 0
+            self.file_meta = {}
+            self.terms = TermDictionary()
+            self.documents.cache.clear()
+            self._touch()
+
+        with self.metrics.stage("scan"):
+            manifest = self._scan_files()
+        changes = self._apply_manifest(manifest, self.file_meta, workers, progress)
+        if self.persist and (full or any(changes) or not self.index_path.exists()):
+            with self.metrics.stage("save"):
+                self.save_index()
+        return changes
+
+    def update_paths(self, paths, workers: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Brings the index up to date for some paths only, without scanning the whole directory. Used to apply
+        filesystem events: a path may be a file or a directory that was created, changed, deleted or renamed.
+        
+        :param paths: The paths that changed. Paths outside the directory or inside hidden directories are ignored.
+        :param workers: Overrides the number of build processes given to the constructor for this call.
+        :return: A tuple (added_or_changed, removed) with the number of files that were re-indexed and dropped.
+        """
+        with self.lock:
+            manifest = {}
+            indexed = set()
+            gone_dirs = []
+            for path in {os.path.abspath(path) for path in paths}:
+                if not self._is_watched(path):
+                    continue
+                if os.path.isdir(path):
+                    manifest.update(self._scan_files(path))
+                    gone_dirs.append(path)  # files that used to be under it may be gone too
+                elif os.path.isfile(path):
+                    if os.path.splitext(path)[1].lower() in FILE_TYPES and self._in_shard(path):
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            # deleted since isfile, e.g. an editor's short-lived temporary file
+                            gone_dirs.append(path)
+                        else:
+                            manifest[path] = (stat.st_mtime_ns, stat.st_size)
+                else:
+                    # deleted or moved away, and it may have been a directory
+                    gone_dirs.append(path)
+                if path in self.file_meta:
+                    indexed.add(path)
+            if gone_dirs:
+                prefixes = tuple(os.path.join(path, "") for path in gone_dirs)
+                indexed.update(path for path in self.file_meta if path.startswith(prefixes))
+            return self._apply_manifest(manifest, {path: self.file_meta[path] for path in indexed}, workers)
+
+    def _is_watched(self, path: str) -> bool:
+        """
+        Tells whether a path lies in the indexed directory and outside of hidden directories.
+        
+        :param path: A normalized path.
+        :return: True if files at or under the path may be indexed.
+        """
+        relative = os.path.relpath(path, self.directory)
+        if relative == ".":
+            return True
+        parts = relative.split(os.sep)
+        return parts[0] != ".." and not any(part.startswith(".") for part in parts[:-1]) \
+            and not (parts[-1].startswith(".") and os.path.isdir(path))
+
+    def _apply_manifest(self, manifest, indexed, workers: Optional[int],
+                        progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int]:
+        """
+        Re-indexes the files whose signature changed and drops the ones that no longer exist.
+        
+        :param manifest: path -> (mtime_ns, size) of the files on disk that were looked at.
+        :param indexed: path -> (mtime_ns, size) of the indexed files that were looked at.
+        :param workers: Number of build processes, None for the one given to the constructor.
+        :param progress: Called with (files_done, files_total) as files are read.
+        :return: A tuple (added_or_changed, removed) with the number of files that were re-indexed and dropped.
+        """
+        stale = [path for path, signature in indexed.items() if manifest.get(path) != signature]
+        fresh = [path for path, signature in manifest.items() if self.file_meta.get(path) != signature]
+
+        self._remove_files(stale)
+        workers = self.workers if workers is None else workers
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        self._index_files(fresh, manifest, workers, progress)
+        return len(fresh), len(set(stale) - set(fresh))
+
+    def _index_files(self, paths, manifest, workers: int = 1, progress: Optional[Callable[[int, int], None]] = None):
+        """
+        Reads and tokenizes files and adds them to the index.
+        
+        Every file gets the next free doc id up front. With more than one worker the files are split into chunks
+        that are tokenized in a process pool; chunks are merged in id order, so the resulting index is identical to
+        a serial build.
+        
+        :param paths: The paths of the files to index.
+        :param manifest: The scan manifest holding the (mtime_ns, size) of each path.
+        :param workers: Number of worker processes.
+        :param progress: Called with (files_done, files_total) after every chunk.
+        """
+        new_tokens = []
+        first_id = len(self.doc_paths)
+        docs = [(first_id + i, path) for i, path in enumerate(paths)]
+        self.doc_paths.extend([None] * len(docs))
+        self.doc_lengths.extend([0] * len(docs))
+
+        done = 0
+        if workers > 1 and len(docs) >= PARALLEL_MIN_FILES:
+            # a few chunks per worker keeps every process busy when file sizes are uneven
+            chunk_size = max(1, min(256, len(docs) // (workers * 4)))
+            chunks = [docs[i:i + chunk_size] for i in range(0, len(docs), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.analyzer,)) as pool:
+                results = pool.map(_index_chunk, chunks)
+                for chunk in chunks:
+                    # the workers read and tokenize, so this is the time spent waiting for them
+                    with self.metrics.stage("read_tokenize"):
+                        result = next(results)
+                    with self.metrics.stage("merge"):
+                        new_tokens += self._merge_chunk(chunk, *result, manifest)
+                    done += len(chunk)
+                    if progress is not None:
+                        progress(done, len(docs))
+        else:
+            for i in range(0, len(docs), 256):
+                chunk = docs[i:i + 256]
+                with self.metrics.stage("read_tokenize"):
+                    result = _index_chunk(chunk, self.analyzer)
+                with self.metrics.stage("merge"):
+                    new_tokens += self._merge_chunk(chunk, *result, manifest)
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, len(docs))
+        # added once for the whole build, which is cheaper than once per chunk
+        with self.metrics.stage("term_dictionary"):
+            self.terms.add(new_tokens)
+
+    def _touch(self):
+        """
+        Records a change to the index: bumps the generation and drops the cached results of older generations.
+        """
+        self.generation += 1
+        self.result_cache.clear()
+        self.preview_cache.clear()
+
+    def _merge_chunk(self, chunk, partial_index, doc_terms, doc_lengths, errors, manifest):
+        """
+        Adds the output of _index_chunk to the index.
+        
+        :param chunk: The (doc_id, path) pairs that were given to _index_chunk.
+        :param partial_index: token -> PostingList of the chunk.
+        :param doc_terms: doc id -> distinct tokens of the files of the chunk that could be read.
+        :param doc_lengths: doc id -> number of tokens of the files of the chunk that could be read.
+        :param errors: Messages about files that could not be read.
+        :param manifest: The scan manifest holding the (mtime_ns, size) of each path.
+        :return: The tokens that were new to the index.
+        """
+        for error in errors:
+            print(error)
+        if self.metrics.enabled:
+            self.metrics.count("files_read", len(doc_terms))
+            self.metrics.count("bytes_read", sum(manifest[path][1] for doc_id, path in chunk if doc_id in doc_terms))
+            self.metrics.count("tokens", sum(doc_lengths.values()))
+            if errors:
+                self.metrics.count("read_errors", len(errors))
+        if doc_terms:
+            self._touch()
+        new_tokens = []
+        for token, posting in partial_index.items():
+            existing = self.inverted_index.get(token)
+            if existing is None:
+                # interned so the keys are shared with doc_terms instead of stored once per document
+                token = sys.intern(token)
+                self.inverted_index[token] = posting
+                new_tokens.append(token)
+            else:
+                existing.extend(posting)
+        for doc_id, path in chunk:
+            if doc_id not in doc_terms:
+                continue
+            self.doc_paths[doc_id] = path
+            self.doc_ids[path] = doc_id
+            self.doc_terms[doc_id] = tuple(sys.intern(token) for token in doc_terms[doc_id])
+            self.doc_lengths[doc_id] = doc_lengths[doc_id]
+            self.total_length += doc_lengths[doc_id]
+            self.file_meta[path] = manifest[path]
+            self.documents.invalidate(path)
+        return new_tokens
+
+    def _remove_files(self, paths):
+        """
+        Drops files from the index.
+        
+        :param paths: The paths to remove.
+        """
+        removed = {}  # token -> ids of the removed documents containing it
+        for path in paths:
+            doc_id = self.doc_ids.pop(path, None)
+            if doc_id is None:
+                continue
+            self._touch()
+            for token in self.doc_terms.pop(doc_id):
+                removed.setdefault(token, []).append(doc_id)
+            self.doc_paths[doc_id] = None
+            self.total_length -= self.doc_lengths[doc_id]
+            self.doc_lengths[doc_id] = 0
+            del self.file_meta[path]
+            self.documents.invalidate(path)
+        # every posting list is rebuilt once, however many of its documents go
+        gone_tokens = []
+        for token, doc_ids in removed.items():
+            posting = self.inverted_index[token]
+            posting.remove_many(doc_ids)
+            if not posting:
+                del self.inverted_index[token]
+                gone_tokens.append(token)
+        self.terms.remove(gone_tokens)
 
-    def search(self, query, phrase_search: bool = False) -> List[Tuple[str,str]]:
+    def load_index(self) -> bool:
+        """
+        Loads a previously saved index from index_path.
+        
+        The file is ignored if it is missing, unreadable, was written by another INDEX_VERSION, belongs to another
+        directory or shard or was built with a different analyzer.
+        
+        :return: True if the index was loaded.
+        """
+        try:
+            with self.index_path.open('rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Could not load index {self.index_path}: {str(e)}")
+            return False
+
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION \
+                or data.get("directory") != str(self.directory) \
+                or data.get("analyzer") != self.analyzer.signature() \
+                or data.get("shard") != self.shard:
+            return False
+        self.inverted_index = data["inverted_index"]
+        self.doc_paths = data["doc_paths"]
+        self.doc_ids = {path: doc_id for doc_id, path in enumerate(self.doc_paths) if path is not None}
+        self.doc_terms = data["doc_terms"]
+        self.doc_lengths = data["doc_lengths"]
+        self.total_length = sum(self.doc_lengths)
+        self.file_meta = data["file_meta"]
+        self.terms = data["terms"]
+        self._touch()
+        return True
+
+    def save_index(self):
+        """
+        Writes the index to index_path. The file is replaced atomically so a crash never leaves a half-written index.
+        """
+        data = {
+            "version": INDEX_VERSION,
+            "directory": str(self.directory),
+            "analyzer": self.analyzer.signature(),
+            "shard": self.shard,
+            "inverted_index": self.inverted_index,
+            "doc_paths": self.doc_paths,
+            "doc_terms": self.doc_terms,
+            "doc_lengths": self.doc_lengths,
+            "file_meta": self.file_meta,
+            "terms": self.terms,
+        }
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.index_path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Could not save index {self.index_path}: {str(e)}")
+
+    def search(self, query, phrase_search: bool = False, limit: Optional[int] = RESULT_LIMIT) -> List[Tuple[str,str]]:
         """
         Searches the indexed text files for the given query.
         
         :param query: The search query.
         :param phrase_search: If True, performs a phrase search. If False, performs a token search.
-        :return: A list of tuples, each containing a file path and a preview of the content.
+        :param limit: How many of the best matches to return, or None for all of them.
+        :return: A list of tuples, each containing a file path and a preview of the content, best match first.
+        """
+        with self.metrics.profile("search"), self.metrics.stage("search"):
+            results = []
+            with self.lock:
+                tokens = self.query_terms(query)
+                # previews are the expensive part, so they are only built for the hits that are returned
+                for path, _ in self.rank(query, phrase_search, limit):
+                    results.append((path, self._get_preview(path, tokens)))
+        return results
+
+    def iter_search(self, query, phrase_search: bool = False, limit: Optional[int] = RESULT_LIMIT,
+                    cancel: Optional[threading.Event] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Like search, but yields the results one at a time as their previews are built, so a caller in another thread
+        can show them as they arrive.
+        
+        :param query: The search query.
+        :param phrase_search: If True, performs a phrase search. If False, performs a token search.
+        :param limit: How many of the best matches to return, or None for all of them.
+        :param cancel: When this event is set the search stops before the next result.
+        :return: An iterator of tuples, each containing a file path and a preview of the content, best match first.
         """
-        tokens = self.tokenize(query)
+        with self.metrics.profile("search"):
+            hits = self.rank(query, phrase_search, limit)
+        tokens = self.query_terms(query)
+        for path, _ in hits:
+            if cancel is not None and cancel.is_set():
+                return
+            yield path, self._get_preview(path, tokens)
+
+    def rank(self, query, phrase_search: bool = False, limit: Optional[int] = RESULT_LIMIT) -> List[Tuple[str, float]]:
+        """
+        Finds the best matches for a query by their BM25 score, without building previews.
+        
+        :param query: The search query.
+        :param phrase_search: If True, only files containing the query as a phrase match. If False, files containing
+            any of the query tokens match.
+        :param limit: How many of the best matches to return, or None for all of them.
+        :return: A list of (path, score) tuples, best match first.
+        """
+        tokens, offsets = self._analyze_query(query)
         if not tokens:
-            return[]
+            return []
+        # word order only matters to phrases, so "a b" and "b a" share a cache entry
+        terms = (tokens, offsets) if phrase_search else tuple(sorted(set(tokens)))
+        with self.lock:
+            key = (self.generation, phrase_search, terms, limit)
+            hits = self.result_cache.get(key)
+            if hits is None:
+                with self.metrics.stage("rank"):
+                    hits = self._rank(tokens, offsets, phrase_search, limit)
+                self.result_cache.put(key, hits)
+        return list(hits)
+
+    def _rank(self, tokens, offsets, phrase_search: bool, limit: Optional[int]) -> List[Tuple[str, float]]:
+        """
+        Ranks the matches of an analyzed query.
         
+        :param tokens: The stemmed query tokens.
+        :param offsets: The position of each token within the query.
+        :param phrase_search: If True, performs a phrase search. If False, performs a token search.
+        :param limit: How many of the best matches to return, or None for all of them.
+        :return: A list of (path, score) tuples, best match first.
+        """
+        # repeated query tokens count once, in query order so scores add up the same way every time
+        terms = list(dict.fromkeys(tokens))
+        scorer = BM25(self.doc_lengths, len(self.doc_ids), self.total_length)
+        # wildcard and fuzzy terms are expanded once per query
+        lookup = {token: self._postings(token) for token in terms}
+        postings = [lookup[token] for token in terms if lookup[token] is not None]
+        if self.metrics.enabled:
+            self.metrics.count("queries")
+            self.metrics.count("postings_touched", sum(len(posting) for posting in postings))
         if phrase_search:
-            results = set(self.files.keys())
+            with self.metrics.stage("phrase_match"):
+                doc_ids = self._phrase_search(tokens, offsets, lookup)
+            hits = scorer.rank(postings, doc_ids, limit) if doc_ids else []
         else:
-            results = set(self.inverted_index[tokens[0]])
+            hits = scorer.top_k(postings, limit)
+        return [(self.doc_paths[doc_id], score) for score, doc_id in hits]
+
+    def _analyze_query(self, query) -> Tuple[Tuple[str, ...], Tuple[int, ...]]:
+        """
+        Tokenizes a query, remembering the result for repeated queries.
+        
+        :param query: The search query.
+        :return: A tuple (tokens, offsets) with the stemmed tokens and the position of each within the query.
+            Wildcard and fuzzy terms are kept as patterns, see _query_positions.
+        """
+        analyzed = self.query_cache.get(query)
+        if analyzed is None:
+            with self.metrics.stage("analyze_query"):
+                positions = self._query_positions(query)
+                analyzed = tuple(token for _, token in positions), tuple(position for position, _ in positions)
+            self.query_cache.put(query, analyzed)
+        return analyzed
+
+    def _query_positions(self, query) -> List[Tuple[int, str]]:
+        """
+        Numbers the tokens of a query like Analyzer.positions, but keeps the terms written with * or ? (wildcards)
+        or ending in ~ or ~N (fuzzy terms) as patterns, which the analyzer would strip of their punctuation.
         
-        for token in tokens[1:]:
-            if phrase_search:
-                results &= set(self.inverted_index[token])
+        :param query: The search query.
+        :return: A list of (position, token) pairs. A fuzzy term becomes "stem~distance", a wildcard term its
+            lowercased pattern.
+        """
+        words = query.split()
+        if not any(is_pattern(word) for word in words):
+            return list(self.analyzer.positions(query))
+        positions = []
+        position = 0
+        for word in words:
+            pattern = parse_pattern(word, FUZZY_DISTANCE, MAX_FUZZY_DISTANCE)
+            if pattern is None:
+                positions.extend(self.analyzer.positions(word, position))
+            elif pattern[1] is not None:
+                # fuzzy terms are compared to stems, so the term is stemmed too
+                base, distance = pattern
+                positions.extend((p, f"{token}~{distance}") for p, token in self.analyzer.positions(base, position))
+            elif pattern[0].strip("*"):
+                positions.append((position, pattern[0]))
+            if self.analyzer.split(word):
+                position += 1
+        return positions
+
+    def _postings(self, token) -> Optional[PostingList]:
+        """
+        Looks up the postings of a query token. A wildcard or fuzzy token gets the merged postings of the terms it
+        expands to.
+        
+        :param token: A token as returned by _analyze_query.
+        :return: The posting list, or None if no document contains the token.
+        """
+        posting = self.inverted_index.get(token)
+        if posting is not None or not is_pattern(token):
+            return posting
+        terms = self._expand(token)
+        return merge(self.inverted_index[term] for term in terms) if terms else None
+
+    def _expand(self, token) -> List[str]:
+        """
+        Finds the terms of the index that a wildcard or fuzzy token stands for, at most MAX_EXPANSIONS of them.
+        
+        :param token: A wildcard pattern or a fuzzy "stem~distance" token.
+        :return: The terms: for a wildcard the ones in most documents, for a fuzzy term the closest ones and among
+            those the ones in most documents.
+        """
+        with self.lock:
+            frequency = lambda term: len(self.inverted_index[term])
+            base, fuzzy, distance = token.rpartition("~")
+            if fuzzy:
+                matches = self.terms.fuzzy(base, int(distance))
+                matches.sort(key=lambda match: (match[1], -frequency(match[0])))
+                terms = [term for term, _ in matches[:MAX_EXPANSIONS]]
+            else:
+                terms = heapq.nlargest(MAX_EXPANSIONS, self.terms.wildcard(token), key=frequency)
+        if self.metrics.enabled:
+            self.metrics.count("expanded_terms", len(terms))
+        return terms
+
+    def query_terms(self, query) -> List[str]:
+        """
+        Returns the terms of a query as they occur in the index, with wildcard and fuzzy terms replaced by what they
+        expand to. Used to find and highlight the query in a document.
+        
+        :param query: The search query.
+        :return: A list of stemmed tokens.
+        """
+        tokens, _ = self._analyze_query(query)
+        terms = []
+        for token in tokens:
+            if token not in self.inverted_index and is_pattern(token):
+                terms.extend(self._expand(token))
             else:
-                results |= set(self.inverted_index[token])
+                terms.append(token)
+        return terms
+
+    def cache_stats(self) -> Dict[str, dict]:
+        """
+        Returns the hit and miss counters and the sizes of the search caches, to help size them.
+        
+        :return: A dictionary mapping the name of each cache to its stats.
+        """
+        return {
+            "queries": self.query_cache.stats(),
+            "results": self.result_cache.stats(),
+            "previews": self.preview_cache.stats(),
+            "documents": self.documents.cache.stats(),
+        }
 
+    def metrics_snapshot(self) -> dict:
+        """
+        Returns the recorded stage timers and counters together with the cache and stem cache counters.
+        
+        Stems computed in index build worker processes are not in the stem cache counters.
         
-        return [(str(file), self._get_preview(self.files[str(file)], tokens)) for file in results]
+        :return: A JSON serializable dictionary.
+        """
+        snapshot = self.metrics.snapshot()
+        snapshot["caches"] = self.cache_stats()
+        stem_info = self.analyzer.stem_cache_info()
+        if stem_info is not None:
+            snapshot["stem_cache"] = {"hits": stem_info.hits, "misses": stem_info.misses,
+                                      "entries": stem_info.currsize}
+        return snapshot
 
-    def _token_search(self, tokens):
+    def _token_search(self, tokens, lookup: Optional[Dict[str, PostingList]] = None) -> List[int]:
         """
         Performs a token-based search.
         
         :param tokens: The list of stemmed tokens to search for.
-        :return: A set of file paths that contain all of the tokens.
+        :param lookup: The postings of the tokens if they were already looked up.
+        :return: The ascending ids of the documents that contain all of the tokens.
         """
-        results = set(self.files.keys())
-        for token in tokens:
-            results &= set(self.inverted_index[token])
-        return results
+        postings = [lookup[token] if lookup else self._postings(token) for token in set(tokens)]
+        if not all(postings):
+            return []
+        return intersect(postings)
     
-    def _phrase_search(self, tokens, original_phrase):
+    def _phrase_search(self, tokens, offsets: Optional[List[int]] = None,
+                       lookup: Optional[Dict[str, PostingList]] = None) -> List[int]:
         """
-        Performs a phrase search.
+        Performs a phrase search using the token positions stored in the inverted index.
         
         :param tokens: The list of stemmed tokens that make up the phrase.
-        :param original_phrase: The original search phrase.
-        :return: A set of file paths that contain the phrase.
-        """
-        results = set()
-        for file, content in self.files.items():
-            start = 0
-            while True:
-                start = content.lower().find(original_phrase.lower(), start)
-                if start == -1:
+        :param offsets: The position of each token within the phrase, which skips stopwords. Defaults to 0, 1, 2...
+        :param lookup: The postings of the tokens if they were already looked up.
+        :return: The ascending ids of the documents that contain the tokens next to each other in the given order.
+        """
+        if lookup is None:
+            lookup = {token: self._postings(token) for token in set(tokens)}
+        candidates = self._token_search(tokens, lookup)
+        if not candidates or len(tokens) == 1:
+            return candidates
+        if offsets is None:
+            offsets = range(len(tokens))
+        postings = [lookup[token] for token in tokens]
+        # check the rarest tokens first, they rule out a candidate position the quickest
+        order = sorted(range(len(tokens)), key=lambda i: len(postings[i]))
+        # candidates are ascending, so each list is only ever searched forward from the last hit
+        cursors = [0] * len(tokens)
+        results = []
+        for doc_id in candidates:
+            starts = None
+            for i in order:
+                cursors[i] = postings[i].find(doc_id, cursors[i])
+                # a phrase starts at p if the i-th token of the phrase occurs at p + offsets[i]
+                shifted = {position - offsets[i] for position in postings[i].positions_at(cursors[i])}
+                starts = shifted if starts is None else starts & shifted
+                if not starts:
                     break
-                # Verify that the surrounding context contains the individual stemmed tokens
-                end = start + len(original_phrase)
-                surrounding_text = content[max(0, start-30):min(len(content), end+30)]
-                if all(stemmed_token in self.tokenize(surrounding_text) for stemmed_token in tokens):
-                    results.add(file)
-                    break  # No need to search for additional occurrences in this file
-                start += len(original_phrase)
+            if starts:
+                results.append(doc_id)
         return results
 
-    def _get_preview(self, content, tokens):
+    def _get_preview(self, path, tokens):
         """
-        Returns a preview of the content where the tokens appear.
+        Returns a preview of a file where the tokens appear. Only the part of the file around the match is read.
         
-        :param content: The content of a file.
+        :param path: The path of an indexed file.
         :param tokens: The list of stemmed tokens to search for.
         :return: A string containing a preview of the content.
         """
-        # Return the first PREVIEW_LENGTH around the token
-        start = max(content.lower().find(tokens[0]) - PREVIEW_LENGTH/2, 0)
-        end = min(start + PREVIEW_LENGTH, len(content))
-        return content[start:end]
+        key = (self.generation, path, tuple(tokens))
+        preview = self.preview_cache.get(key)
+        if preview is None:
+            # Return the first PREVIEW_LENGTH around the token
+            with self.metrics.stage("preview"):
+                preview = self.documents.preview(path, tokens, PREVIEW_LENGTH)
+            self.preview_cache.put(key, preview)
+        return preview
+
+    def read_document(self, path) -> str:
+        """
+        Returns the full text of an indexed file, served from a bounded cache of recently viewed files.
+        
+        :param path: The path of the file.
+        :return: The content of the file.
+        """
+        return self.documents.read(path)
 
     def tokenize(self, text):
         """
@@ -127,10 +784,7 @@ class ScrollSearch:
         :param text: The text to be tokenized.
         :return: A list of stemmed tokens.
         """
-        translator = str.maketrans("", "", string.punctuation)
-        tokens = text.translate(translator).lower().split()
-        stemmed_tokens = [self.stemmer.stem(token) for token in tokens]
-        return stemmed_tokens
+        return self.analyzer.analyze(text)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,319 @@
+import heapq
+import multiprocessing
+import os
+import traceback
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .config import *
+from .searcher import ScrollSearch
+
+
+def _shard_call(searcher: ScrollSearch, method: str, args: tuple):
+    """
+    Runs a request on the ScrollSearch of a shard.
+
+    :param searcher: The index of the shard.
+    :param method: "rank", "previews", "build_index", "update_paths" or "cache_stats".
+    :param args: The arguments of the method.
+    :return: What the method returned.
+    """
+    if method == "previews":
+        paths, query = args
+        tokens = searcher.query_terms(query)
+        return [searcher._get_preview(path, tokens) for path in paths]
+    if method in ("rank", "build_index", "update_paths", "cache_stats"):
+        return getattr(searcher, method)(*args)
+    raise ValueError(f"Unknown shard request {method}.")
+
+
+def _serve_shard(conn, kwargs):
+    """
+    Runs in a shard worker process: builds or loads the index of the shard and answers requests from the pipe
+    until it is closed or gets None.
+
+    :param conn: The worker's end of the pipe.
+    :param kwargs: The arguments of the shard's ScrollSearch.
+    """
+    try:
+        searcher = ScrollSearch(**kwargs)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {str(e)}"))
+        return
+    conn.send(("ok", None))
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        try:
+            conn.send(("ok", _shard_call(searcher, *request)))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+    conn.close()
+
+
+class _LocalShard:
+    """
+    A shard whose index lives in this process. Requests run when their answer is received.
+    """
+
+    def __init__(self, kwargs):
+        self.directory = kwargs["directory"]
+        self.searcher = ScrollSearch(**kwargs)
+        self._request = None
+
+    def send(self, method: str, *args):
+        self._request = (method, args)
+
+    def receive(self):
+        method, args = self._request
+        self._request = None
+        return _shard_call(self.searcher, method, args)
+
+    def close(self):
+        pass
+
+
+class _ProcessShard:
+    """
+    A shard whose index lives in a worker process, so shards build and answer queries in parallel.
+    """
+
+    def __init__(self, kwargs):
+        self.directory = kwargs["directory"]
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve_shard, args=(child, kwargs), daemon=True,
+                                               name="papyrus-shard")
+        self.process.start()
+        child.close()
+
+    def send(self, method: str, *args):
+        self.conn.send((method, args))
+
+    def receive(self):
+        try:
+            status, value = self.conn.recv()
+        except EOFError:
+            raise RuntimeError(f"The shard worker for {self.directory} died.")
+        if status == "error":
+            raise RuntimeError(f"Shard of {self.directory} failed: {value}")
+        return value
+
+    def close(self):
+        if self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.conn.close()
+
+
+class ShardedSearch:
+    """
+    Searches several directories at once, with one independent index per directory or, for large directories, per
+    group of files picked by a hash of their path.
+
+    Every shard is a ScrollSearch that is built, saved and refreshed on its own. With processes=True each shard lives
+    in its own worker process, so shards are built in parallel, no single process has to hold the whole corpus and a
+    query is ranked by all shards at the same time. The best hits of the shards are merged by score, and previews are
+    only built for the hits that are returned.
+
+    Scores use the term statistics of each shard, so with uneven shards the merged ranking can differ slightly from
+    that of a single index over all files.
+    """
+
+    def __init__(self, directories, shards_per_root: int = SHARDS_PER_ROOT, processes: bool = True,
+                 persist: bool = True, **kwargs):
+        """
+        Initializes the ShardedSearch object and builds or loads the index of every shard.
+
+        :param directories: The directories containing text files to be searched.
+        :param shards_per_root: Into how many shards each directory is split.
+        :param processes: If True, every shard runs in a worker process. If False, all shards live in this process.
+        :param persist: If False, the shard indexes are built in memory only and never loaded from or saved to disk.
+        :param kwargs: More arguments for the ScrollSearch of every shard, e.g. analyzer or workers. workers only
+            applies with processes=False: shard processes can not start a process pool of their own, and the shards
+            already build in parallel, so each of them builds with a single process.
+        """
+        if isinstance(directories, (str, Path)):
+            directories = [directories]
+        # resolved like ScrollSearch does, so update_paths routes paths to shards by the paths the shards store
+        self.directories = [Path(directory).resolve() for directory in directories]
+        for directory in self.directories:
+            if not directory.exists() or not directory.is_dir():
+                raise ValueError(f"Provided path {directory} is not a valid directory.")
+        if shards_per_root < 1:
+            raise ValueError("shards_per_root must be at least 1.")
+        self.shards_per_root = shards_per_root
+        self.processes = processes
+        kwargs.pop("index_path", None)  # every shard has its own
+        if processes:
+            # shard processes are daemonic, which may not have children
+            kwargs["workers"] = 1
+
+        shard_type = _ProcessShard if processes else _LocalShard
+        self.shards = []
+        try:
+            for directory in self.directories:
+                for index in range(shards_per_root):
+                    shard = (index, shards_per_root) if shards_per_root > 1 else None
+                    self.shards.append(shard_type(dict(kwargs, directory=str(directory), persist=persist,
+                                                       shard=shard, index_path=None)))
+            # process shards report back once their index is ready
+            if processes:
+                for shard in self.shards:
+                    shard.receive()
+        except BaseException:
+            self.close()
+            raise
+
+    def _fan_out(self, method: str, *args, shards=None) -> list:
+        """
+        Sends a request to shards and collects their answers. Process shards work on it at the same time.
+
+        :param method: The request, see _shard_call.
+        :param args: Its arguments.
+        :param shards: The shards to ask, all of them by default.
+        :return: The answers in the order of the shards.
+        """
+        shards = self.shards if shards is None else shards
+        return self._ask([(shard, method, args) for shard in shards])
+
+    @staticmethod
+    def _ask(requests) -> list:
+        """
+        Sends requests to shards and collects the answers. Every shard that got a request is read even if another
+        one failed, so no answer is left in a pipe to be taken for the answer to the next request.
+
+        :param requests: (shard, method, args) tuples, at most one per shard.
+        :return: The answers in the order of the requests.
+        :raises Exception: The first error of a shard, once all answers are in.
+        """
+        error = None
+        sent = []
+        for shard, method, args in requests:
+            try:
+                shard.send(method, *args)
+            except Exception as e:
+                error = e
+                break
+            sent.append(shard)
+        answers = []
+        for shard in sent:
+            try:
+                answers.append(shard.receive())
+            except Exception as e:
+                answers.append(None)
+                error = error or e
+        if error is not None:
+            raise error
+        return answers
+
+    def build_index(self, full: bool = False) -> Tuple[int, int]:
+        """
+        Brings the index of every shard up to date with its directory, see ScrollSearch.build_index.
+
+        :param full: If True, every shard throws away its index and re-reads its files.
+        :return: A tuple (added_or_changed, removed) with the number of files that were re-indexed and dropped.
+        """
+        changes = self._fan_out("build_index", full)
+        return sum(added for added, _ in changes), sum(removed for _, removed in changes)
+
+    def update_paths(self, paths) -> Tuple[int, int]:
+        """
+        Brings the index up to date for some paths only, see ScrollSearch.update_paths.
+
+        :param paths: The paths that changed.
+        :return: A tuple (added_or_changed, removed) with the number of files that were re-indexed and dropped.
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        requests = []
+        for shard in self.shards:
+            prefix = os.path.join(shard.directory, "")
+            # a shard ignores the files of its directory that hash to other shards itself
+            mine = [path for path in paths if os.path.join(path, "").startswith(prefix)]
+            if mine:
+                requests.append((shard, "update_paths", (mine,)))
+        changes = self._ask(requests)
+        return sum(added for added, _ in changes), sum(removed for _, removed in changes)
+
+    def rank(self, query, phrase_search: bool = False, limit: Optional[int] = RESULT_LIMIT) -> List[Tuple[str, float]]:
+        """
+        Finds the best matches for a query in all shards, without building previews.
+
+        :param query: The search query.
+        :param phrase_search: If True, performs a phrase search. If False, performs a token search.
+        :param limit: How many of the best matches to return, or None for all of them.
+        :return: A list of (path, score) tuples, best match first.
+        """
+        return [(path, score) for path, score, _ in self._rank(query, phrase_search, limit)]
+
+    def _rank(self, query, phrase_search: bool, limit: Optional[int]) -> List[Tuple[str, float, int]]:
+        """
+        Merges the best hits of every shard.
+
+        :return: A list of (path, score, shard number) tuples, best match first.
+        """
+        partials = self._fan_out("rank", query, phrase_search, limit)
+        # each shard already returns its hits best first, ties stay in shard order
+        merged = heapq.merge(*[[(path, score, number) for path, score in hits]
+                               for number, hits in enumerate(partials)], key=lambda hit: -hit[1])
+        return list(merged if limit is None else (hit for hit, _ in zip(merged, range(limit))))
+
+    def search(self, query, phrase_search: bool = False, limit: Optional[int] = RESULT_LIMIT) -> List[Tuple[str, str]]:
+        """
+        Searches all shards for the given query.
+
+        :param query: The search query.
+        :param phrase_search: If True, performs a phrase search. If False, performs a token search.
+        :param limit: How many of the best matches to return, or None for all of them.
+        :return: A list of tuples, each containing a file path and a preview of the content, best match first.
+        """
+        hits = self._rank(query, phrase_search, limit)
+        by_shard: Dict[int, List[str]] = {}
+        for path, _, number in hits:
+            by_shard.setdefault(number, []).append(path)
+        numbers = list(by_shard)
+        answers = self._ask([(self.shards[number], "previews", (by_shard[number], query)) for number in numbers])
+        previews = {}
+        for number, answer in zip(numbers, answers):
+            previews.update(zip(by_shard[number], answer))
+        return [(path, previews[path]) for path, _, _ in hits]
+
+    def iter_search(self, query, phrase_search: bool = False, limit: Optional[int] = RESULT_LIMIT,
+                    cancel=None) -> Iterator[Tuple[str, str]]:
+        """
+        Like search, but yields the results one at a time, see ScrollSearch.iter_search.
+        """
+        for result in self.search(query, phrase_search, limit):
+            if cancel is not None and cancel.is_set():
+                return
+            yield result
+
+    def cache_stats(self) -> List[Dict[str, dict]]:
+        """
+        Returns the cache counters of every shard, see ScrollSearch.cache_stats.
+
+        :return: A list with the stats of each shard, in shard order.
+        """
+        return self._fan_out("cache_stats")
+
+    def close(self):
+        """
+        Stops the shard worker processes.
+        """
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,134 @@
+import mmap
+import re
+from typing import List, Optional
+
+from .cache import LRUCache
+from .config import *
+
+
+class DocumentStore:
+    """
+    Reads indexed documents from disk on demand instead of keeping their text in memory.
+
+    Whole documents are only read when they are asked for and kept in a bounded cache of recently viewed documents.
+    Previews are cut out of a memory map of the file, so only the pages around the match are ever read.
+    """
+
+    def __init__(self, cache_bytes: int = DOCUMENT_CACHE_BYTES, encoding: str = "utf-8"):
+        """
+        Initializes the DocumentStore object.
+
+        :param cache_bytes: Maximum total size of the cached document texts.
+        :param encoding: The encoding of the documents.
+        """
+        self.encoding = encoding
+        self.cache = LRUCache(max_bytes=cache_bytes)
+
+    def read(self, path: str) -> str:
+        """
+        Returns the full text of a document, from the cache if it was read recently.
+
+        :param path: The path of the document.
+        :return: The decoded text.
+        """
+        content = self.cache.get(path)
+        if content is None:
+            with open(path, 'rb') as f:
+                content = f.read().decode(self.encoding, errors="replace")
+            self.cache.put(path, content)
+        return content
+
+    def find(self, path: str, terms: List[str]) -> Optional[int]:
+        """
+        Finds the first case-insensitive occurrence of any of the terms in a document without reading all of it.
+
+        :param path: The path of the document.
+        :param terms: The terms to look for.
+        :return: The byte offset of the first occurrence, or None if none of the terms occurs.
+        """
+        pattern = re.compile(b"|".join(re.escape(term.encode(self.encoding)) for term in terms), re.IGNORECASE)
+        with open(path, 'rb') as f, _map(f) as data:
+            match = pattern.search(data)
+        return match.start() if match else None
+
+    def read_range(self, path: str, start: int, length: int) -> str:
+        """
+        Reads part of a document. Characters cut in half at either end of the range are dropped.
+
+        :param path: The path of the document.
+        :param start: The byte offset to start reading at.
+        :param length: The number of bytes to read.
+        :return: The decoded text.
+        """
+        with open(path, 'rb') as f:
+            f.seek(max(start, 0))
+            data = f.read(length)
+        return data.decode(self.encoding, errors="ignore")
+
+    def preview(self, path: str, terms: List[str], length: int = PREVIEW_LENGTH) -> str:
+        """
+        Returns a preview of a document around the first occurrence of the terms.
+
+        :param path: The path of the document.
+        :param terms: The terms to center the preview on.
+        :param length: The length of the preview.
+        :return: A string containing a preview of the content.
+        """
+        content = self.cache.get(path)
+        if content is not None:
+            return _get_preview(content, terms, length)
+        try:
+            offset = self.find(path, terms) if terms else None
+            start = max((offset or 0) - length // 2, 0)
+            return self.read_range(path, start, length)
+        except OSError as e:
+            print(f"Could not read file {path}: {str(e)}")
+            return ""
+
+    def invalidate(self, path: str):
+        """
+        Drops a document from the cache, for example because it changed on disk.
+
+        :param path: The path of the document.
+        """
+        self.cache.pop(path)
+
+
+def _get_preview(content: str, terms: List[str], length: int = PREVIEW_LENGTH) -> str:
+    """
+    Returns a preview of text that is already in memory around the first occurrence of the terms.
+
+    :param content: The text of a document.
+    :param terms: The terms to center the preview on.
+    :param length: The length of the preview.
+    :return: A string containing a preview of the content.
+    """
+    lowered = content.lower()
+    offsets = [offset for offset in (lowered.find(term) for term in terms) if offset != -1]
+    start = max(min(offsets, default=0) - length // 2, 0)
+    return content[start:start + length]
+
+
+class _EmptyMap(bytes):
+    """
+    Stands in for the memory map of an empty file, which mmap refuses to create.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def _map(f):
+    """
+    Memory maps an open file for reading.
+
+    :param f: The file opened in binary mode.
+    :return: The map, usable as a context manager.
+    """
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        return _EmptyMap()
@@ -0,0 +1,314 @@
+import re
+import string
+from array import array
+from bisect import bisect_left, insort
+from fnmatch import translate
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Removes the punctuation of a wildcard pattern except for the wildcards themselves
+PATTERN_TABLE = str.maketrans("", "", string.punctuation.replace("*", "").replace("?", ""))
+
+# a ? ending a word is taken for a question mark, not a wildcard
+_WILDCARD = re.compile(r"\*|\?(?!$)")
+_FUZZY = re.compile(r"~(\d*)$")
+
+
+def is_pattern(word: str) -> bool:
+    """
+    Tells whether a query word or token is a wildcard (auth*, colo?r) or fuzzy (recieve~, recieve~2) term.
+
+    :param word: The word.
+    :return: True if it is a pattern.
+    """
+    return bool(_FUZZY.search(word) or _WILDCARD.search(word))
+
+
+def parse_pattern(word: str, distance: int, max_distance: int) -> Optional[Tuple[str, Optional[int]]]:
+    """
+    Splits a query word into what it matches.
+
+    :param word: The word as typed.
+    :param distance: The edit distance of a fuzzy term without a number.
+    :param max_distance: The largest edit distance a fuzzy term may ask for.
+    :return: (base, distance) for a fuzzy term, (pattern, None) for a wildcard term with the pattern lowercased and
+        stripped of other punctuation, or None for a plain word.
+    """
+    fuzzy = _FUZZY.search(word)
+    if fuzzy:
+        return word[:fuzzy.start()], min(int(fuzzy.group(1) or distance), max_distance)
+    if _WILDCARD.search(word):
+        return word.lower().rstrip("?").translate(PATTERN_TABLE), None
+    return None
+
+
+def _grams(padded: str) -> set:
+    """
+    Returns the trigrams of a string.
+
+    :param padded: The string, with "$" marking where a term starts and ends.
+    :return: The set of its three character substrings.
+    """
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def levenshtein(a: str, b: str, limit: int) -> Optional[int]:
+    """
+    Computes the edit distance of two strings, giving up as soon as it must exceed limit.
+
+    :param a: The first string.
+    :param b: The second string.
+    :param limit: The largest distance of interest.
+    :return: The distance, or None if it is greater than limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+    previous = list(range(len(a) + 1))
+    for i, char in enumerate(b, 1):
+        current = [i]
+        best = i
+        for j, other in enumerate(a, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            current.append(cost)
+            best = min(best, cost)
+        # every later row is at least the minimum of this one
+        if best > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+class TermDictionary:
+    """
+    The distinct terms of an index in sorted order, for prefix, wildcard and fuzzy lookups that do not have to look
+    at every term.
+
+    Prefixes are a binary searched range of the sorted terms. Wildcards and fuzzy terms first narrow the candidates
+    with an index from each trigram of the terms, padded with "$" at both ends, to the terms containing it. Fuzzy terms
+    too short for that walk the sorted terms and skip every range of them whose prefix is already too far off.
+
+    Terms are added and removed as the index changes. The trigram index refers to terms by an id that does not
+    change when other terms come and go, so only the trigrams of the changed terms are touched.
+    """
+
+    def __init__(self, terms: Iterable[str] = ()):
+        """
+        Initializes the TermDictionary object.
+
+        :param terms: The terms of the index.
+        """
+        self.terms: List[str] = []  # the terms in sorted order
+        self.ids: Dict[str, int] = {}  # term -> its id
+        self.names: List[Optional[str]] = []  # id -> term, None for the ids of removed terms
+        self.free: List[int] = []  # ids of removed terms, given to the next new ones
+        self.grams: Dict[str, array] = {}  # trigram -> ids of the terms containing it
+        self.add(terms)
+
+    def add(self, terms: Iterable[str]):
+        """
+        Adds terms. Terms that are already in the dictionary are skipped.
+
+        :param terms: The new terms.
+        """
+        new = sorted({term for term in terms if term not in self.ids})
+        if len(new) < 64:
+            # moving the tail of the list for each of a few terms is cheaper than copying the whole list
+            for term in new:
+                insort(self.terms, term)
+        elif new:
+            # one pass copying the runs of old terms between the new ones
+            merged = []
+            start = 0
+            for term in new:
+                end = bisect_left(self.terms, term, start)
+                merged += self.terms[start:end]
+                merged.append(term)
+                start = end
+            merged += self.terms[start:]
+            self.terms = merged
+        for term in new:
+            if self.free:
+                term_id = self.free.pop()
+                self.names[term_id] = term
+            else:
+                term_id = len(self.names)
+                self.names.append(term)
+            self.ids[term] = term_id
+            for gram in _grams(f"${term}$"):
+                ids = self.grams.get(gram)
+                if ids is None:
+                    ids = self.grams[gram] = array('I')
+                ids.append(term_id)
+
+    def remove(self, terms: Iterable[str]):
+        """
+        Removes terms. Terms that are not in the dictionary are skipped.
+
+        :param terms: The terms to remove.
+        """
+        gone = sorted({term for term in terms if term in self.ids})
+        if len(gone) < 64:
+            for term in gone:
+                del self.terms[bisect_left(self.terms, term)]
+        else:
+            kept = []
+            start = 0
+            for term in gone:
+                end = bisect_left(self.terms, term, start)
+                kept += self.terms[start:end]
+                start = end + 1
+            kept += self.terms[start:]
+            self.terms = kept
+        for term in gone:
+            term_id = self.ids.pop(term)
+            self.names[term_id] = None
+            self.free.append(term_id)
+            for gram in _grams(f"${term}$"):
+                ids = self.grams[gram]
+                ids.remove(term_id)
+                if not ids:
+                    del self.grams[gram]
+
+    def __len__(self):
+        return len(self.terms)
+
+    def prefix(self, prefix: str) -> List[str]:
+        """
+        Finds the terms starting with a prefix.
+
+        :param prefix: The prefix.
+        :return: The matching terms in sorted order.
+        """
+        start = bisect_left(self.terms, prefix)
+        end = bisect_left(self.terms, prefix + "\U0010ffff", start)
+        return self.terms[start:end]
+
+    def wildcard(self, pattern: str) -> List[str]:
+        """
+        Finds the terms matching a pattern in which * stands for any characters and ? for any one character.
+
+        :param pattern: The pattern.
+        :return: The matching terms in sorted order.
+        """
+        literal = re.split(r"[*?]", pattern, maxsplit=1)[0]
+        if len(literal) == len(pattern):
+            return [pattern] if self.prefix(pattern)[:1] == [pattern] else []
+        regex = re.compile(translate(pattern))
+        # the trigrams within the literal parts of the pattern must all be in a matching term
+        grams = set()
+        for part in re.split(r"[*?]+", f"${pattern}$"):
+            grams |= _grams(part)
+        if grams and len(literal) < 3:
+            candidates = self._with_grams(grams)
+        else:
+            # a long enough literal prefix already is a narrow range
+            candidates = self.prefix(literal)
+        return [term for term in candidates if regex.match(term)]
+
+    def fuzzy(self, term: str, distance: int) -> List[Tuple[str, int]]:
+        """
+        Finds the terms within an edit distance of a term.
+
+        An edit changes at most three trigrams, so a term within the distance shares all but 3 * distance of the
+        term's trigrams, which rules out most terms before the edit distance is computed. Terms too short for that
+        are looked up by _walk instead.
+
+        :param term: The term.
+        :param distance: The largest number of inserted, deleted or replaced characters.
+        :return: (term, distance) pairs, closest first and in sorted order within a distance.
+        """
+        grams = _grams(f"${term}$")
+        needed = len(grams) - 3 * distance
+        if needed > 0:
+            counts = {}
+            for gram in grams:
+                for i in self.grams.get(gram, ()):
+                    counts[i] = counts.get(i, 0) + 1
+            matches = []
+            for candidate in sorted(self.names[i] for i, count in counts.items() if count >= needed):
+                found = levenshtein(term, candidate, distance)
+                if found is not None:
+                    matches.append((candidate, found))
+        else:
+            # too short for the trigrams to rule anything out
+            matches = self._walk(term, distance)
+        matches.sort(key=lambda match: match[1])
+        return matches
+
+    def _walk(self, term: str, distance: int) -> List[Tuple[str, int]]:
+        """
+        Finds the terms within an edit distance of a term by walking the sorted terms like a trie.
+
+        Each prefix gets a row of edit distances to the prefixes of the term, computed from the row of the prefix
+        one character shorter, so terms sharing a prefix share its rows. Once every entry of a row exceeds the
+        distance no term with that prefix can match, and the whole range of them is skipped with a binary search.
+        Entries are capped at distance + 1, which leaves few distinct rows, so the transitions between them are
+        remembered and most characters cost a dict lookup.
+
+        :param term: The term.
+        :param distance: The largest number of inserted, deleted or replaced characters.
+        :return: (term, distance) pairs in sorted order.
+        """
+        cap = distance + 1
+        # the row of the empty prefix, and the row that rules a prefix out
+        rows = [tuple(min(j, cap) for j in range(len(term) + 1)), (cap,) * (len(term) + 1)]
+        row_ids = {row: row_id for row_id, row in enumerate(rows)}
+        moves = [{}, {}]  # row id -> character -> id of the next row
+
+        def step(row_id: int, char: str) -> int:
+            above = rows[row_id]
+            row = [min(above[0] + 1, cap)]
+            for j in range(1, len(above)):
+                row.append(min(above[j] + 1, row[j - 1] + 1, above[j - 1] + (term[j - 1] != char), cap))
+            row = tuple(row)
+            next_id = row_ids.get(row)
+            if next_id is None:
+                next_id = row_ids[row] = len(rows)
+                rows.append(row)
+                moves.append({})
+            moves[row_id][char] = next_id
+            return next_id
+
+        matches = []
+        path = [0]  # row ids of the prefixes of previous, from the empty one on
+        previous = ""
+        i = 0
+        while i < len(self.terms):
+            word = self.terms[i]
+            shared = 0
+            longest = min(len(previous), len(word), len(path) - 1)
+            while shared < longest and previous[shared] == word[shared]:
+                shared += 1
+            del path[shared + 1:]
+            previous = word
+            row_id = path[-1]
+            for k in range(shared, len(word)):
+                row_id = moves[row_id].get(word[k])
+                if row_id is None:
+                    row_id = step(path[-1], word[k])
+                path.append(row_id)
+                if row_id == 1:
+                    i = bisect_left(self.terms, word[:k + 1] + "\U0010ffff", i + 1)
+                    break
+            else:
+                if rows[row_id][-1] <= distance:
+                    matches.append((word, rows[row_id][-1]))
+                i += 1
+        return matches
+
+    def _with_grams(self, grams: set) -> List[str]:
+        """
+        Intersects the term lists of trigrams, rarest first.
+
+        :param grams: The trigrams.
+        :return: The terms containing all of them in sorted order.
+        """
+        lists = sorted((self.grams.get(gram, array('I')) for gram in grams), key=len)
+        result = set(lists[0])
+        for ids in lists[1:]:
+            if not result:
+                break
+            result.intersection_update(ids)
+        return sorted(self.names[i] for i in result)
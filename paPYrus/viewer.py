@@ -0,0 +1,137 @@
+import os
+from typing import Tuple
+
+from .config import *
+
+
+class FileWindow:
+    """
+    Gives out a file in chunks of whole lines, so a viewer only ever holds the part of a large file that is on screen.
+
+    The file is read with seek and read rather than kept memory mapped: it may be truncated while it is shown, e.g.
+    by log rotation, and touching a map past the new end of the file kills the process with SIGBUS.
+    """
+
+    def __init__(self, path: str, chunk_size: int = VIEWER_CHUNK_BYTES, encoding: str = "utf-8"):
+        """
+        Initializes the FileWindow object and opens the file.
+
+        :param path: The file to show.
+        :param chunk_size: The approximate size of a chunk in bytes.
+        :param encoding: The encoding of the file.
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self._file = open(path, 'rb')
+
+    @property
+    def size(self) -> int:
+        """
+        The current size of the file in bytes, looked up on every use since the file may shrink or grow.
+        """
+        return os.fstat(self._file.fileno()).st_size
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        self._file.close()
+
+    def _bytes(self, start: int, end: int) -> bytes:
+        """
+        Reads part of the file, less of it or nothing if the file ends earlier.
+
+        :param start: The byte offset to start at.
+        :param end: The byte offset to stop at.
+        :return: The bytes.
+        """
+        start = max(start, 0)
+        if end <= start:
+            return b""
+        self._file.seek(start)
+        return self._file.read(end - start)
+
+    def line_start(self, offset: int) -> int:
+        """
+        Finds the start of the line containing a byte offset.
+
+        :param offset: A byte offset in the file.
+        :return: The offset of the first byte of the line.
+        """
+        if offset <= 0:
+            return 0
+        # a very long line is cut instead of being searched back to its start
+        low = max(0, offset - self.chunk_size)
+        newline = self._bytes(low, offset).rfind(b"\n")
+        if newline == -1:
+            return self._align(low)
+        return low + newline + 1
+
+    def chunk_end(self, start: int) -> int:
+        """
+        Finds where a chunk starting at a line start ends: after the first newline past chunk_size bytes, or earlier
+        if the line is very long.
+
+        :param start: The offset the chunk starts at.
+        :return: The offset just past the chunk.
+        """
+        target = start + self.chunk_size
+        size = self.size
+        if target >= size:
+            return size
+        newline = self._bytes(target, target + self.chunk_size).find(b"\n")
+        if newline == -1:
+            return self._align(target)
+        return target + newline + 1
+
+    def chunk_before(self, end: int) -> Tuple[int, int]:
+        """
+        Returns the chunk of whole lines that ends where another chunk starts.
+
+        :param end: The start of the following chunk.
+        :return: A tuple (start, end) of byte offsets.
+        """
+        return self.line_start(end - self.chunk_size), end
+
+    def chunk_around(self, offset: int) -> Tuple[int, int]:
+        """
+        Returns a chunk of whole lines with the byte offset near its middle. Within a line too long for that the
+        chunk is cut around the offset instead, so the offset is always in the chunk.
+
+        :param offset: The byte offset to show, for example of a search match.
+        :return: A tuple (start, end) of byte offsets with start <= offset < end, unless offset is past the end of
+            the file.
+        """
+        offset = min(max(offset, 0), self.size)
+        start = self.line_start(offset - self.chunk_size // 2)
+        end = self.chunk_end(start)
+        if end <= offset:
+            start = self._align(offset - self.chunk_size // 2)
+            end = self.chunk_end(start)
+        return start, end
+
+    def read(self, start: int, end: int) -> str:
+        """
+        Decodes part of the file.
+
+        :param start: The byte offset to start at.
+        :param end: The byte offset to stop at.
+        :return: The text.
+        """
+        return self._bytes(start, end).decode(self.encoding, errors="replace")
+
+    def _align(self, offset: int) -> int:
+        """
+        Moves an offset back to the start of a character, so a chunk boundary never splits one.
+
+        :param offset: A byte offset.
+        :return: The offset of the first byte of the character containing it.
+        """
+        offset = min(max(offset, 0), self.size)
+        while offset > 0:
+            byte = self._bytes(offset, offset + 1)
+            if not byte or byte[0] & 0xC0 != 0x80:
+                break
+            offset -= 1
+        return offset
@@ -0,0 +1,303 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Optional, Set
+
+from .config import *
+
+
+# inotify event flags, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF \
+    | IN_MOVE_SELF | IN_ONLYDIR
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class InotifyBackend:
+    """
+    Reports changed paths under a directory using Linux inotify, with one watch per directory.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Initializes the InotifyBackend object and watches every non-hidden directory under directory.
+
+        :param directory: The directory to watch.
+        :raises OSError: If inotify is not available or the directory can not be watched.
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux.")
+        self.directory = directory
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watches = {}  # watch descriptor -> directory path
+        self._wake_read, self._wake_write = os.pipe()  # lets wakeup interrupt a read
+        try:
+            self._watch_tree(directory)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, top: str):
+        """
+        Adds watches for a directory and all non-hidden directories below it.
+
+        :param top: The directory.
+        """
+        for root, dirs, _ in os.walk(top):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, f"Could not watch {root}: {os.strerror(errno)}")
+            self.watches[wd] = root
+
+    def _unwatch_tree(self, top: str):
+        """
+        Removes the watches of a directory that was moved away and of the directories below it.
+
+        :param top: The old path of the directory.
+        """
+        prefix = os.path.join(top, "")
+        for wd, path in list(self.watches.items()):
+            if path == top or path.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def read(self, timeout: float) -> Set[str]:
+        """
+        Waits for events.
+
+        :param timeout: Longest time to wait in seconds.
+        :return: The paths that were created, changed, deleted or renamed.
+        """
+        ready, _, _ = select.select([self.fd, self._wake_read], [], [], timeout)
+        if self.fd not in ready:
+            return set()
+        data = b""
+        while True:
+            try:
+                data += os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, only a rescan of everything is safe
+                paths.add(self.directory)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            parent = self.watches.get(wd)
+            if parent is None:
+                continue
+            path = os.path.join(parent, name) if name else parent
+            paths.add(path)
+            if mask & IN_ISDIR and not name.startswith("."):
+                if mask & IN_MOVED_FROM:
+                    self._unwatch_tree(path)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self._watch_tree(path)
+                    except OSError as e:
+                        print(str(e))
+        return paths
+
+    def wakeup(self):
+        """
+        Makes a pending or the next read return at once.
+        """
+        os.write(self._wake_write, b"\0")
+
+    def close(self):
+        """
+        Releases the inotify instance.
+        """
+        if self.fd >= 0:
+            os.close(self.fd)
+            os.close(self._wake_read)
+            os.close(self._wake_write)
+            self.fd = -1
+
+
+class PollingBackend:
+    """
+    Reports changed paths by rescanning the directory, for systems without inotify.
+    """
+
+    def __init__(self, searcher, interval: float = WATCH_POLL_INTERVAL):
+        """
+        Initializes the PollingBackend object.
+
+        :param searcher: The ScrollSearch whose directory is watched. Its scan is compared to the indexed files.
+        :param interval: Seconds between two scans.
+        """
+        self.searcher = searcher
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self.next_scan = time.monotonic()
+
+    def read(self, timeout: float) -> Set[str]:
+        """
+        Waits until the next scan is due or timeout passes.
+
+        :param timeout: Longest time to wait in seconds.
+        :return: The paths whose files were added, changed or deleted since they were indexed.
+        """
+        wait = self.next_scan - time.monotonic()
+        if wait > timeout:
+            self._wakeup.wait(timeout)
+            return set()
+        if self._wakeup.wait(max(wait, 0)):
+            return set()
+        self.next_scan = time.monotonic() + self.interval
+        manifest = self.searcher._scan_files()
+        with self.searcher.lock:
+            indexed = dict(self.searcher.file_meta)
+        changed = {path for path, signature in manifest.items() if indexed.get(path) != signature}
+        changed.update(path for path in indexed if path not in manifest)
+        return changed
+
+    def wakeup(self):
+        """
+        Makes a pending or the next read return at once.
+        """
+        self._wakeup.set()
+
+    def close(self):
+        """
+        Nothing to release when polling.
+        """
+
+
+class IndexWatcher:
+    """
+    Keeps a ScrollSearch up to date with its directory from a background thread.
+
+    Changes are collected until WATCH_DEBOUNCE seconds pass without new ones, or for at most WATCH_MAX_DELAY seconds,
+    and then applied in one batch with ScrollSearch.update_paths. A git checkout touching thousands of files thus
+    becomes a single index update.
+    """
+
+    def __init__(self, searcher, debounce: float = WATCH_DEBOUNCE, max_delay: float = WATCH_MAX_DELAY,
+                 poll_interval: float = WATCH_POLL_INTERVAL, use_inotify: bool = True,
+                 on_update: Optional[Callable] = None):
+        """
+        Initializes the IndexWatcher object.
+
+        :param searcher: The ScrollSearch to keep up to date.
+        :param debounce: Seconds without events after which pending changes are applied.
+        :param max_delay: Longest time in seconds a change waits while events keep coming.
+        :param poll_interval: Seconds between scans when polling.
+        :param use_inotify: If False, always polls.
+        :param on_update: Called from the watcher thread with (added_or_changed, removed) after every batch.
+        """
+        self.searcher = searcher
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.on_update = on_update
+        self.backend = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts watching. Falls back to polling if inotify can not be used.
+        """
+        if self._thread is not None:
+            return
+        self.backend = None
+        if self.use_inotify:
+            try:
+                self.backend = InotifyBackend(str(self.searcher.directory))
+            except (OSError, AttributeError) as e:
+                print(f"Could not use inotify, polling instead: {str(e)}")
+        if self.backend is None:
+            self.backend = PollingBackend(self.searcher, self.poll_interval)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="papyrus-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops watching and waits for the watcher thread to finish.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self.backend.wakeup()
+        self._thread.join()
+        self._thread = None
+        self.backend.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _run(self):
+        pending = set()
+        first_event = last_event = 0.0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if pending:
+                timeout = max(0.0, min(last_event + self.debounce, first_event + self.max_delay) - now)
+            else:
+                timeout = self.poll_interval
+            paths = self.backend.read(timeout)
+            now = time.monotonic()
+            if paths:
+                if not pending:
+                    first_event = now
+                pending |= paths
+                last_event = now
+            if pending and (now - last_event >= self.debounce or now - first_event >= self.max_delay):
+                batch, pending = pending, set()
+                self._apply(batch)
+
+    def _apply(self, paths):
+        """
+        Applies a batch of changed paths to the index.
+
+        :param paths: The changed paths.
+        """
+        try:
+            changes = self.searcher.update_paths(paths)
+        except Exception as e:
+            print(f"Could not update the index: {str(e)}")
+            return
+        if self.on_update is not None and any(changes):
+            self.on_update(*changes)
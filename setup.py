@@ -17,6 +17,7 @@ setup(
     entry_points={
         "console_scripts": [
             "papyrus=paPYrus.gui:main",
+            "papyrus-search=paPYrus.cli:main",
         ],
     },
 )
@@ -0,0 +1,40 @@
+import io
+import random
+
+from paPYrus.analyzer import Analyzer
+
+
+def test_stream_positions_punctuation_at_chunk_end():
+    analyzer = Analyzer(stemmer=None)
+    for text in ["foo !bar baz", "see (note) here", "text **bold** text", "foo!!bar baz"]:
+        expected = list(analyzer.positions(text))
+        for chunk_size in range(1, len(text) + 1):
+            assert list(analyzer.stream_positions(io.StringIO(text), chunk_size)) == expected, (text, chunk_size)
+
+
+def test_stream_positions_matches_positions():
+    rng = random.Random(0)
+    pieces = ["word", "Other", "(note)", "**bold**", "-", "a.b", "!!", " ", "  ", "\n", "é"]
+    analyzer = Analyzer(stemmer=None, stopwords={"word"})
+    for _ in range(200):
+        text = "".join(rng.choice(pieces) + rng.choice(["", " "]) for _ in range(rng.randint(0, 30)))
+        chunk_size = rng.randint(1, 12)
+        assert list(analyzer.stream_positions(io.StringIO(text), chunk_size)) == list(analyzer.positions(text))
+
+
+class _Stemmer:
+    def __init__(self, suffix):
+        self.suffix = suffix
+        self.signature = f"strip-{suffix}"
+
+    def stem(self, word):
+        return word[:-len(self.suffix)] if word.endswith(self.suffix) else word
+
+
+def test_signature_tells_stemmers_apart():
+    assert Analyzer(_Stemmer("s")).signature() != Analyzer(_Stemmer("ing")).signature()
+    assert Analyzer(_Stemmer("s")).signature() == Analyzer(_Stemmer("s")).signature()
+    assert Analyzer(stemmer=None).signature() != Analyzer().signature()
+    # no signature and only the default repr: nothing to tell two of them apart by
+    anonymous = type("Anonymous", (), {"stem": lambda self, word: word})
+    assert Analyzer(anonymous()).signature() is None
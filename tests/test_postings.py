@@ -0,0 +1,89 @@
+import pickle
+import random
+
+import pytest
+
+from paPYrus.postings import PostingList, decode_positions, encode_positions
+
+
+def _random_positions(rng):
+    # gaps of one, two and three varint bytes
+    positions = []
+    position = 0
+    for _ in range(rng.randint(1, 20)):
+        position += rng.choice([0 if not positions else 1, rng.randint(1, 0x7F), rng.randint(0x80, 0x3FFF),
+                                rng.randint(0x4000, 0x1FFFFF)])
+        positions.append(position)
+    return positions
+
+
+def _contents(posting):
+    return {doc_id: posting.positions_at(i) for i, doc_id in enumerate(posting.doc_ids)}
+
+
+def test_positions_round_trip():
+    rng = random.Random(0)
+    out = bytearray(b"\x01\x02")
+    written = []
+    for _ in range(200):
+        positions = _random_positions(rng)
+        written.append((len(out), positions))
+        encode_positions(positions, out)
+    for start, positions in written:
+        assert decode_positions(out, start, len(positions)) == positions
+
+
+def test_add_extend_remove():
+    rng = random.Random(1)
+    for _ in range(50):
+        expected = {}
+        posting = PostingList()
+        doc_id = 0
+        for _ in range(rng.randint(0, 30)):
+            doc_id += rng.randint(1, 5)
+            expected[doc_id] = _random_positions(rng)
+            # built from chunks the way the index merges them
+            chunk = PostingList()
+            chunk.add(doc_id, expected[doc_id])
+            if rng.random() < 0.5:
+                posting.extend(chunk)
+            else:
+                posting.add(doc_id, expected[doc_id])
+        assert _contents(posting) == expected
+
+        for doc_id in rng.sample(sorted(expected), len(expected) // 2):
+            assert posting.remove(doc_id)
+            assert not posting.remove(doc_id)
+            del expected[doc_id]
+            assert _contents(posting) == expected
+        assert list(posting.freqs) == [len(expected[doc_id]) for doc_id in posting.doc_ids]
+        assert _contents(pickle.loads(pickle.dumps(posting))) == expected
+
+
+def test_ids_must_ascend():
+    posting = PostingList()
+    posting.add(5, [1])
+    with pytest.raises(ValueError):
+        posting.add(5, [2])
+    other = PostingList()
+    other.add(3, [1])
+    with pytest.raises(ValueError):
+        posting.extend(other)
+    posting.extend(PostingList())
+    assert list(posting.doc_ids) == [5]
+
+
+def test_remove_many():
+    rng = random.Random(2)
+    for _ in range(50):
+        posting = PostingList()
+        expected = {}
+        for doc_id in sorted(rng.sample(range(100), rng.randint(0, 60))):
+            expected[doc_id] = _random_positions(rng)
+            posting.add(doc_id, expected[doc_id])
+        gone = rng.sample(range(100), rng.randint(0, 100))
+        assert posting.remove_many(gone + gone[:3]) == len(set(gone) & set(expected))
+        for doc_id in gone:
+            expected.pop(doc_id, None)
+        assert _contents(posting) == expected
+        assert list(posting.freqs) == [len(expected[doc_id]) for doc_id in posting.doc_ids]
@@ -0,0 +1,34 @@
+import random
+from array import array
+
+from paPYrus.postings import PostingList
+from paPYrus.ranking import BM25
+
+
+def _random_index(rng, doc_count, term_count):
+    # few distinct lengths and frequencies, so there are plenty of tied scores
+    doc_lengths = array('I', (rng.choice([5, 10, 20, 40]) for _ in range(doc_count)))
+    postings = []
+    for _ in range(term_count):
+        posting = PostingList()
+        df = rng.randint(1, doc_count)
+        for doc_id in sorted(rng.sample(range(doc_count), df)):
+            posting.add(doc_id, list(range(rng.choice([1, 1, 2, 3]))))
+        postings.append(posting)
+    return BM25(doc_lengths, doc_count, sum(doc_lengths)), postings
+
+
+def test_top_k_matches_exhaustive():
+    rng = random.Random(0)
+    for _ in range(100):
+        bm25, postings = _random_index(rng, rng.randint(1, 200), rng.randint(1, 6))
+        expected = bm25._exhaustive(postings)
+        for k in (1, 5, 10, 50):
+            assert bm25.top_k(postings, k) == expected[:k]
+        assert bm25.top_k(postings, None) == expected
+
+
+def test_top_k_without_matches():
+    bm25, postings = _random_index(random.Random(1), 10, 2)
+    assert bm25.top_k([PostingList()], 10) == []
+    assert bm25.top_k(postings, 0) == []
@@ -0,0 +1,101 @@
+import random
+import re
+from fnmatch import translate
+
+from paPYrus.analyzer import Analyzer
+from paPYrus.searcher import ScrollSearch
+from paPYrus.terms import TermDictionary, _grams, levenshtein
+
+
+def _random_term(rng, letters="abcde", longest=7):
+    return "".join(rng.choice(letters) for _ in range(rng.randint(1, longest)))
+
+
+def _brute_fuzzy(terms, term, distance):
+    matches = [(other, levenshtein(term, other, distance)) for other in sorted(terms)]
+    return sorted([match for match in matches if match[1] is not None], key=lambda match: match[1])
+
+
+def _check_consistent(dictionary, terms):
+    assert dictionary.terms == sorted(terms)
+    assert set(dictionary.ids) == set(terms)
+    assert all(dictionary.names[term_id] == term for term, term_id in dictionary.ids.items())
+    assert sorted(dictionary.free) == [term_id for term_id, name in enumerate(dictionary.names) if name is None]
+    expected = {}
+    for term in terms:
+        for gram in _grams(f"${term}$"):
+            expected.setdefault(gram, []).append(dictionary.ids[term])
+    assert {gram: sorted(ids) for gram, ids in dictionary.grams.items()} == \
+        {gram: sorted(ids) for gram, ids in expected.items()}
+
+
+def test_levenshtein():
+    assert levenshtein("kitten", "sitting", 3) == 3
+    assert levenshtein("kitten", "sitting", 2) is None
+    assert levenshtein("", "abc", 3) == 3
+    assert levenshtein("abc", "abc", 0) == 0
+
+
+def test_fuzzy_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(20):
+        terms = {_random_term(rng) for _ in range(rng.randint(0, 400))}
+        dictionary = TermDictionary(terms)
+        # short terms are walked, long ones go through the trigram filter
+        for term in [_random_term(rng, "abcdef", 10) for _ in range(30)] + [""]:
+            distance = rng.randint(0, 2)
+            assert dictionary.fuzzy(term, distance) == _brute_fuzzy(terms, term, distance), (term, distance)
+
+
+def test_wildcard_matches_brute_force():
+    rng = random.Random(1)
+    for _ in range(20):
+        terms = {_random_term(rng) for _ in range(rng.randint(0, 400))}
+        dictionary = TermDictionary(terms)
+        for _ in range(30):
+            pattern = "".join(rng.choice(["a", "b", "c", "*", "?"]) for _ in range(rng.randint(1, 6)))
+            regex = re.compile(translate(pattern))
+            assert dictionary.wildcard(pattern) == sorted(term for term in terms if regex.match(term)), pattern
+        assert dictionary.prefix("ab") == sorted(term for term in terms if term.startswith("ab"))
+
+
+def test_add_and_remove_reuse_ids():
+    rng = random.Random(2)
+    dictionary = TermDictionary()
+    terms = set()
+    for _ in range(300):
+        # a few terms take the one at a time path, many the merging one
+        batch = [_random_term(rng, "abcd", 5) for _ in range(rng.choice([1, 5, 100]))]
+        if rng.random() < 0.5:
+            dictionary.add(batch)
+            terms.update(batch)
+        else:
+            batch += rng.sample(sorted(terms), min(len(terms), len(batch)))
+            dictionary.remove(batch)
+            terms.difference_update(batch)
+        _check_consistent(dictionary, terms)
+        term = _random_term(rng, "abcd", 5)
+        assert dictionary.fuzzy(term, 1) == _brute_fuzzy(terms, term, 1)
+    # removed ids were given to later terms instead of growing the id space with every change
+    assert len(dictionary.names) < 1024
+
+
+def test_dictionary_follows_the_index(tmp_path):
+    rng = random.Random(3)
+    words = [_random_term(rng, "abcdefgh", 6) for _ in range(200)]
+    for i in range(30):
+        (tmp_path / f"{i}.txt").write_text(" ".join(rng.choices(words, k=20)))
+    searcher = ScrollSearch(str(tmp_path), persist=False, analyzer=Analyzer(stemmer=None))
+    _check_consistent(searcher.terms, searcher.inverted_index)
+    for _ in range(10):
+        changed = rng.sample(range(40), 5)
+        for i in changed:
+            path = tmp_path / f"{i}.txt"
+            if path.exists() and rng.random() < 0.5:
+                path.unlink()
+            else:
+                path.write_text(" ".join(rng.choices(words, k=rng.randint(0, 20))))
+        searcher.update_paths([str(tmp_path / f"{i}.txt") for i in changed])
+        _check_consistent(searcher.terms, searcher.inverted_index)
+    searcher.build_index(full=True)
+    _check_consistent(searcher.terms, searcher.inverted_index)